@@ -0,0 +1,175 @@
+"""Admission control: per-key token buckets and global load shedding."""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from .config import settings
+from .monitoring import record_admission_rejection
+from .services.errors import err_overloaded, err_rate_limit
+
+
+class _Shard:
+    __slots__ = ("buckets", "lock")
+
+    def __init__(self) -> None:
+        # key -> [tokens, last_refill]; ordered by last access for idle eviction.
+        self.buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self.lock = threading.Lock()
+
+
+class TokenBucketLimiter:
+    """Sharded in-memory token buckets with O(1) checks and idle eviction."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        *,
+        shards: int = 16,
+        idle_seconds: float = 300,
+        max_keys: int = 100_000,
+        overrides: dict[str, float] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.idle_seconds = idle_seconds
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self.overrides = overrides or {}
+        self._clock = clock
+        self._shards = tuple(_Shard() for _ in range(shards))
+
+    def acquire(self, key: str) -> float:
+        """Take one token for ``key``; return 0 if admitted, else seconds to wait."""
+
+        rate = self.overrides.get(key, self.rate)
+        if rate <= 0:
+            return 0.0
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = self._clock()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = [float(self.burst), now]
+                shard.buckets[key] = bucket
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            self._evict(shard, now)
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / rate
+
+    def refund(self, key: str) -> None:
+        """Return the token taken by an ``acquire`` whose request was rejected elsewhere."""
+
+        shard = self._shards[hash(key) % len(self._shards)]
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def _evict(self, shard: _Shard, now: float) -> None:
+        buckets = shard.buckets
+        while len(buckets) > self.max_keys_per_shard:
+            buckets.popitem(last=False)
+        # Oldest entries sit at the front; stop at the first one still active.
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest[1] <= self.idle_seconds:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
+
+
+class ConcurrencyLimiter:
+    """Non-blocking global cap on in-flight requests."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.limit > 0 and self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        device_limiter: TokenBucketLimiter,
+        ip_limiter: TokenBucketLimiter,
+        concurrency: ConcurrencyLimiter,
+        retry_after_sec: int = 1,
+    ):
+        self.device_limiter = device_limiter
+        self.ip_limiter = ip_limiter
+        self.concurrency = concurrency
+        self.retry_after_sec = retry_after_sec
+
+    @contextmanager
+    def admit(self, client_ip: str, device_id: str | None = None) -> Iterator[None]:
+        """Reject with 429/503 before any work is done, else hold a concurrency slot.
+
+        The IP bucket is always charged: ``device_id`` comes from the request body, so
+        a client rotating it would otherwise never run out of tokens.
+        """
+
+        wait = self.ip_limiter.acquire(client_ip)
+        if wait > 0:
+            record_admission_rejection("rate_limit_ip")
+            raise err_rate_limit(retry_after=math.ceil(wait))
+        if device_id is not None:
+            wait = self.device_limiter.acquire(device_id)
+            if wait > 0:
+                self.ip_limiter.refund(client_ip)
+                record_admission_rejection("rate_limit")
+                raise err_rate_limit(retry_after=math.ceil(wait))
+        if not self.concurrency.try_acquire():
+            record_admission_rejection("overloaded")
+            raise err_overloaded(retry_after=self.retry_after_sec)
+        try:
+            yield
+        finally:
+            self.concurrency.release()
+
+
+def _limiter(rate: float, burst: int) -> TokenBucketLimiter:
+    return TokenBucketLimiter(
+        rate,
+        burst,
+        shards=settings.rate_limit_shards,
+        idle_seconds=settings.rate_limit_idle_sec,
+        max_keys=settings.rate_limit_max_keys,
+        overrides=settings.scan_rate_overrides,
+    )
+
+
+scan_admission = AdmissionController(
+    _limiter(settings.scan_rate_per_sec, settings.scan_rate_burst),
+    _limiter(settings.scan_ip_rate_per_sec, settings.scan_ip_rate_burst),
+    ConcurrencyLimiter(settings.scan_max_in_flight),
+    retry_after_sec=settings.scan_overload_retry_after_sec,
+)
@@ -1,35 +1,40 @@
 """FastAPI application for qriscuy."""
 from __future__ import annotations
 
-from uuid import UUID
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
 import logging
 
-from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
+from fastapi import Depends, FastAPI, Header, Request
 from fastapi.responses import JSONResponse, Response
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .admission import scan_admission
 from .config import settings
+from .dependencies import require_api_key
+from .fingerprint import decode_fingerprint
 from .logging_conf import configure_logging
 from .middleware import RequestLoggingMiddleware
+from .profiling import ProfilingMiddleware, profiler
+from .routers import admin, invoices, templates
+from .runtime_monitor import runtime_monitor
 from .monitoring import metrics_payload, record_service_error
-from .models import Invoice, InvoicePolicy, InvoiceStatus, get_session, init_db
-from .schemas import (
-    ConfirmRequest,
-    ConfirmResponse,
-    GenerateQRRequest,
-    GenerateQRResponse,
-    InvoiceStatusResponse,
-    PolicyEnum,
-    ScanRequest,
-    ScanResponse,
-)
+from .models import CATALOG_SHARD, InvoicePolicy, SessionLocal, init_db, shards
+from .responses import MSGPACK, encode_body, negotiate, respond
+from .schemas import GenerateQRRequest, GenerateQRResponse, ScanRequest, ScanResponse
 from .services.errors import ServiceError
 from .services.generator import InvoiceGenerator
+from .services.idempotency import IdempotencyService, hash_request, run_idempotency_purge_forever
+from .services.retention import run_retention_forever
+from .services.templates import TemplateService
 from .services.scan import ScanService
 
 app = FastAPI(title="qriscuy", version="0.1.0")
+if settings.profiling_enabled:
+    # Added first so it sits inside the logging middleware, closest to the handler.
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
 app.add_middleware(RequestLoggingMiddleware)
 
 logger = logging.getLogger("qriscuy.api")
@@ -53,11 +58,18 @@ async def on_startup() -> None:
     configure_logging()
     _warn_insecure_defaults()
     await init_db()
+    app.state.runtime_task = asyncio.create_task(runtime_monitor.run())
+    app.state.idempotency_purge_task = asyncio.create_task(run_idempotency_purge_forever())
+    if settings.retention_enabled:
+        app.state.retention_task = asyncio.create_task(run_retention_forever())
 
 
-async def require_api_key(x_api_key: str = Header(...)) -> None:
-    if x_api_key != settings.api_key:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    for name in ("runtime_task", "idempotency_purge_task", "retention_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
 
 
 @app.exception_handler(ServiceError)
@@ -69,7 +81,11 @@ async def service_error_handler(request: Request, exc: ServiceError) -> JSONResp
         extra={"code": exc.code, "path": route_path, "method": request.method},
     )
     record_service_error(exc.code, route_path)
-    return JSONResponse(status_code=exc.status_code, content={"code": exc.code, "message": exc.message})
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"code": exc.code, "message": exc.message},
+        headers=exc.headers,
+    )
 
 
 @app.exception_handler(Exception)
@@ -84,8 +100,20 @@ async def unhandled_exception_handler(request: Request, exc: Exception) -> JSONR
 
 
 @app.get("/health", tags=["system"])
-async def health() -> dict[str, str]:
-    return {"status": "ok"}
+async def health(request: Request) -> Response:
+    return respond(request, {"status": "ok"})
+
+
+@app.get("/ready", tags=["system"])
+async def ready(request: Request) -> Response:
+    """Readiness for load balancers: 503 while any saturation threshold is exceeded."""
+
+    is_ready, checks = runtime_monitor.readiness()
+    return respond(
+        request,
+        {"status": "ready" if is_ready else "saturated", "checks": checks},
+        status_code=200 if is_ready else 503,
+    )
 
 
 @app.get("/metrics", tags=["system"])
@@ -94,87 +122,119 @@ async def metrics() -> Response:
     return Response(content=payload, media_type=content_type)
 
 
-@app.post("/v1/qr", response_model=GenerateQRResponse, tags=["qr"], dependencies=[Depends(require_api_key)])
-async def generate_qr(
+app.include_router(templates.router)
+app.include_router(invoices.router)
+app.include_router(admin.router)
+
+
+@asynccontextmanager
+async def _merchant_sessions(merchant_id: str) -> AsyncIterator[tuple[AsyncSession, AsyncSession]]:
+    """Yield ``(catalog, shard)`` sessions; templates live on the catalog shard."""
+
+    shard = shards.for_merchant(merchant_id)
+    async with shards.session(shard) as session:
+        if shard == CATALOG_SHARD:
+            yield session, session
+        else:
+            async with SessionLocal() as catalog:
+                yield catalog, session
+
+
+async def _create_qr(
     payload: GenerateQRRequest,
-    session: AsyncSession = Depends(get_session),
-) -> GenerateQRResponse:
+    catalog: AsyncSession,
+    session: AsyncSession,
+    media_type: str,
+) -> dict[str, Any]:
+    template = await TemplateService(catalog).resolve(
+        merchant_id=payload.merchant_id,
+        template_id=payload.template_id,
+        merchant_payload=payload.merchant_payload,
+    )
     generator = InvoiceGenerator(session)
     policy = InvoicePolicy(payload.policy.value) if payload.policy else None
     result = await generator.create_invoice(
         merchant_id=payload.merchant_id,
-        merchant_payload=payload.merchant_payload,
+        template=template,
         amount=payload.amount,
         currency=payload.currency,
         policy=policy,
     )
     invoice = result.invoice
 
-    return GenerateQRResponse(
-        invoice_id=UUID(invoice.id),
-        status=invoice.status.value,
-        payload=result.encoded.payload,
-        crc=result.encoded.crc,
-        qr_png_base64=result.qr_png_base64,
-        fingerprint_b64=result.fingerprint_b64,
-        signature_hex=result.signature_hex,
-        timestamp=result.timestamp,
-        nonce=result.nonce,
-    )
+    # msgpack clients get raw PNG bytes; JSON encodes the same bytes to base64 once.
+    png_key = "qr_png" if media_type == MSGPACK else "qr_png_base64"
+    return {
+        "invoice_id": invoice.id,
+        "status": invoice.status.value,
+        "payload": result.encoded.payload,
+        "crc": result.encoded.crc,
+        png_key: result.qr_png,
+        "fingerprint_b64": result.fingerprint_b64,
+        "signature_hex": result.signature_hex,
+        "timestamp": result.timestamp,
+        "nonce": result.nonce,
+        "qr_version": result.qr_version,
+        "qr_modules": result.qr_modules,
+        "qr_error_correction": result.qr_error_correction,
+    }
 
 
-@app.post("/v1/scan", response_model=ScanResponse, tags=["scan"], dependencies=[Depends(require_api_key)])
-async def scan_callback(payload: ScanRequest, session: AsyncSession = Depends(get_session)) -> ScanResponse:
-    service = ScanService(session)
-    result = await service.handle_scan(
-        fingerprint_b64=payload.fingerprint_b64,
-        signature_hex=payload.signature_hex,
-        timestamp=payload.timestamp,
-        nonce=payload.nonce,
-        device_id=payload.device_id,
-        client_meta=payload.client_meta,
-    )
+@app.post("/v1/qr", response_model=GenerateQRResponse, tags=["qr"], dependencies=[Depends(require_api_key)])
+async def generate_qr(
+    payload: GenerateQRRequest,
+    request: Request,
+    idempotency_key: str | None = Header(default=None, min_length=1, max_length=255),
+) -> Response:
+    media_type = negotiate(request)
+    async with _merchant_sessions(payload.merchant_id) as (catalog, session):
+        if idempotency_key is None:
+            content = await _create_qr(payload, catalog, session, media_type)
+            return Response(content=encode_body(content, media_type), media_type=media_type)
+
+        async def produce() -> bytes:
+            return encode_body(await _create_qr(payload, catalog, session, media_type), media_type)
+
+        # Keys are scoped to the merchant and stored on its shard, next to the invoice they created.
+        service = IdempotencyService(session, payload.merchant_id)
+        stored, replayed = await service.execute(
+            idempotency_key,
+            hash_request(payload.model_dump_json()),
+            produce,
+            media_type=media_type,
+        )
+    headers = {"Idempotency-Replayed": "true"} if replayed else None
+    return Response(content=stored.body, media_type=stored.media_type, headers=headers)
 
-    return ScanResponse(invoice_id=UUID(result.invoice.id), status=result.invoice.status.value, status_changed=result.status_changed)
 
+def _scan_shard(fingerprint_b64: str) -> int:
+    # Route by the invoice id inside the fingerprint; ScanService still verifies
+    # the signature and rejects malformed input, so fall back to any shard here.
+    try:
+        return shards.for_invoice(decode_fingerprint(fingerprint_b64).invoice_id)
+    except ValueError:
+        return CATALOG_SHARD
 
-@app.get("/v1/invoices/{invoice_id}", response_model=InvoiceStatusResponse, tags=["invoices"], dependencies=[Depends(require_api_key)])
-async def get_invoice(invoice_id: UUID, session: AsyncSession = Depends(get_session)) -> InvoiceStatusResponse:
-    stmt = select(Invoice).where(Invoice.id == str(invoice_id)).limit(1)
-    result = await session.execute(stmt)
-    invoice = result.scalars().first()
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
 
-    return InvoiceStatusResponse(
-        invoice_id=UUID(invoice.id),
-        status=invoice.status.value,
-        policy=PolicyEnum(invoice.policy.value),
-        amount=invoice.amount,
-        currency=invoice.currency,
-        merchant_id=invoice.merchant_id,
+@app.post("/v1/scan", response_model=ScanResponse, tags=["scan"], dependencies=[Depends(require_api_key)])
+async def scan_callback(payload: ScanRequest, request: Request) -> Response:
+    client_ip = request.client.host if request.client else "unknown"
+    # Rejections here happen before a session is opened, so they cost no DB work.
+    with scan_admission.admit(client_ip, payload.device_id):
+        async with shards.session(_scan_shard(payload.fingerprint_b64)) as session:
+            service = ScanService(session)
+            result = await service.handle_scan(
+                fingerprint_b64=payload.fingerprint_b64,
+                signature_hex=payload.signature_hex,
+                timestamp=payload.timestamp,
+                nonce=payload.nonce,
+                device_id=payload.device_id,
+                client_meta=payload.client_meta,
+            )
+
+    return respond(
+        request,
+        {"invoice_id": result.invoice.id, "status": result.invoice.status.value, "status_changed": result.status_changed},
     )
 
 
-@app.post(
-    "/v1/invoices/{invoice_id}/confirm",
-    response_model=ConfirmResponse,
-    tags=["invoices"],
-    dependencies=[Depends(require_api_key)],
-)
-async def confirm_invoice(invoice_id: UUID, payload: ConfirmRequest, session: AsyncSession = Depends(get_session)) -> ConfirmResponse:
-    stmt = select(Invoice).where(Invoice.id == str(invoice_id)).limit(1)
-    result = await session.execute(stmt)
-    invoice = result.scalars().first()
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-
-    if payload.action == "SUCCESS":
-        invoice.status = InvoiceStatus.SUCCESS
-    else:
-        invoice.status = InvoiceStatus.REJECTED
-
-    await session.commit()
-    await session.refresh(invoice)
-
-    return ConfirmResponse(invoice_id=UUID(invoice.id), status=invoice.status.value)
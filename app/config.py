@@ -5,10 +5,14 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Literal
 
-from pydantic import AliasChoices, BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+# Mirrors the terminal members of models.InvoiceStatus (models imports settings).
+RETENTION_STATUSES = frozenset({"SUCCESS", "REJECTED", "EXPIRED"})
+
+
 class LoggingConfig(BaseModel):
     level: str = Field(default="INFO", description="Root logger level")
     json_logs: bool = Field(default=True, description="Enable JSON formatted logs")
@@ -24,11 +28,66 @@ class Settings(BaseSettings):
     api_key: str = Field(default="dev-secret-key")
     hmac_secret: str = Field(default="change-me")
     default_policy: Literal["FAST", "SAFE"] = Field(default="SAFE", validation_alias=AliasChoices("QRISCUY_MODE", "DEFAULT_POLICY"))
+    qr_error_correction: Literal["auto", "L", "M", "Q", "H"] = Field(default="auto")
+    qr_boost_error_correction: bool = Field(default=True)
     ttl_seconds: int = Field(default=300, ge=60, le=3600)
+    scan_rate_per_sec: float = Field(default=5.0, ge=0, description="Token refill rate per device_id on /v1/scan; 0 disables")
+    scan_rate_burst: int = Field(default=10, ge=1)
+    scan_ip_rate_per_sec: float = Field(default=10.0, ge=0, description="Token refill rate per client IP on /v1/scan; 0 disables")
+    scan_ip_rate_burst: int = Field(default=20, ge=1)
+    scan_rate_overrides: dict[str, float] = Field(default_factory=dict, description="Per device_id/IP refill rate overrides")
+    scan_max_in_flight: int = Field(default=64, ge=0, description="Global concurrent /v1/scan cap; 0 disables")
+    scan_overload_retry_after_sec: int = Field(default=1, ge=1)
+    rate_limit_shards: int = Field(default=16, ge=1)
+    rate_limit_idle_sec: int = Field(default=300, ge=1)
+    rate_limit_max_keys: int = Field(default=100_000, ge=1)
+    idempotency_ttl_sec: int = Field(default=86400, ge=60)
+    idempotency_cache_size: int = Field(default=10_000, ge=1)
+    idempotency_lock_timeout_sec: int = Field(default=30, ge=1, description="Lifetime of a pending key reservation")
+    idempotency_poll_interval_ms: int = Field(default=50, ge=1, le=5000, description="How often duplicates re-check a pending key")
+    idempotency_purge_interval_sec: int = Field(default=600, ge=10, description="How often expired idempotency keys are deleted")
+    idempotency_purge_batch_size: int = Field(default=1000, ge=1, le=10_000)
+    export_chunk_size: int = Field(default=1000, ge=1, le=10_000)
+    retention_enabled: bool = Field(default=False)
+    retention_interval_sec: int = Field(default=3600, ge=60)
+    retention_scan_events_days: int = Field(default=90, ge=1)
+    retention_invoice_days: dict[str, int] = Field(
+        default_factory=lambda: {"SUCCESS": 180, "REJECTED": 180, "EXPIRED": 30},
+        description="Days to keep invoices per terminal status before archiving",
+    )
+    retention_expire_created_days: int = Field(default=1, ge=1, description="CREATED invoices older than this are marked EXPIRED")
+    retention_archive_dir: str = Field(default="./archive")
+    retention_batch_size: int = Field(default=500, ge=1, le=10_000)
+    retention_batch_pause_sec: float = Field(default=0.5, ge=0)
+    retention_vacuum_pages: int = Field(default=1000, ge=0)
+    profiling_enabled: bool = Field(default=False, description="Install the request profiling middleware")
+    profiling_sample_rate: float = Field(default=0.0, ge=0, le=1, description="Fraction of requests profiled at random")
+    profiling_header: str = Field(default="X-Qriscuy-Profile", description="Debug header that forces profiling (needs X-API-Key)")
+    profiling_interval_ms: float = Field(default=5.0, gt=0, le=1000)
+    profiling_buffer_size: int = Field(default=256, ge=1, le=10_000)
+    profiling_max_capture_sec: int = Field(default=60, ge=1, le=600)
+    runtime_probe_interval_ms: int = Field(default=100, ge=10, le=10_000, description="Event-loop drift probe period")
+    ready_window_sec: int = Field(default=10, ge=1, le=600, description="Look-back window for saturation peaks")
+    ready_max_loop_lag_ms: float = Field(default=250, ge=0, description="0 disables the check")
+    ready_max_in_flight: int = Field(default=0, ge=0, description="0 disables the check")
+    ready_max_db_checkout_ms: float = Field(default=500, ge=0, description="0 disables the check")
+    ready_max_db_utilization: float = Field(default=0.9, ge=0, le=1, description="Bounded pools only; 0 disables")
+    ready_max_executor_queue: int = Field(default=32, ge=0, description="0 disables the check")
     database_url: str = Field(default="sqlite+aiosqlite:///./qriscuy.db")
+    database_shards: int = Field(default=1, ge=1, le=256, description="SQLite files invoices are hash-partitioned across; only ever increase")
     allowed_origins: list[str] = Field(default_factory=lambda: ["*"])
     logging: LoggingConfig = Field(default_factory=LoggingConfig)
 
+    @field_validator("retention_invoice_days")
+    @classmethod
+    def _check_retention_statuses(cls, value: dict[str, int]) -> dict[str, int]:
+        invalid = sorted(set(value) - RETENTION_STATUSES)
+        if invalid:
+            raise ValueError(f"retention is only allowed for terminal statuses {sorted(RETENTION_STATUSES)}, got {invalid}")
+        if any(days < 1 for days in value.values()):
+            raise ValueError("retention days must be at least 1")
+        return value
+
 
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
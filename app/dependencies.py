@@ -0,0 +1,11 @@
+"""Request dependencies shared by the application and its routers."""
+from __future__ import annotations
+
+from fastapi import Header, HTTPException, status
+
+from .config import settings
+
+
+async def require_api_key(x_api_key: str = Header(...)) -> None:
+    if x_api_key != settings.api_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
@@ -0,0 +1,168 @@
+"""Fingerprint formats embedded in Tag 62 and their HMAC signatures."""
+from __future__ import annotations
+
+import base64
+import hmac
+import secrets
+from dataclasses import dataclass
+from hashlib import sha256
+from uuid import UUID
+
+# Sub-tag 05 markers. Legacy fingerprints carry a pipe-delimited text blob and a
+# full 64-hex HMAC; compact v1 packs the same facts into ~31 bytes plus a
+# 128-bit truncated HMAC so the whole Tag 62 fits inside a 2-digit TLV length.
+ALG_LEGACY = "HMAC-SHA256"
+ALG_COMPACT_V1 = "C1"
+
+COMPACT_V1 = 0x01
+COMPACT_NONCE_BYTES = 6
+COMPACT_MAC_BYTES = 16
+
+
+class SignatureError(Exception):
+    """Raised when a fingerprint's HMAC does not verify."""
+
+
+@dataclass(frozen=True)
+class FingerprintData:
+    invoice_id: str
+    amount: int
+    timestamp: int
+    nonce: str
+    merchant_id: str | None = None
+    algorithm: str = ALG_LEGACY
+
+    @property
+    def compact(self) -> bool:
+        return self.algorithm != ALG_LEGACY
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _write_varint(value: int, out: bytearray) -> None:
+    if value < 0:
+        raise ValueError("Varint value must be non-negative")
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(raw: bytes, idx: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if idx >= len(raw) or shift > 63:
+            raise ValueError("Truncated varint in fingerprint")
+        byte = raw[idx]
+        idx += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, idx
+        shift += 7
+
+
+def new_nonce() -> str:
+    """Return a fresh nonce for a compact fingerprint."""
+
+    return _b64encode(secrets.token_bytes(COMPACT_NONCE_BYTES))
+
+
+def encode_fingerprint(data: FingerprintData) -> str:
+    """Serialize fingerprint data into its compact base64url Tag 62 representation.
+
+    Legacy fingerprints do not fit the 2-digit EMV length and are only ever decoded.
+    """
+
+    if data.algorithm != ALG_COMPACT_V1:
+        raise ValueError(f"Unsupported fingerprint algorithm: {data.algorithm}")
+
+    nonce = _b64decode(data.nonce)
+    if len(nonce) != COMPACT_NONCE_BYTES:
+        raise ValueError("Compact fingerprint nonce must be 6 bytes")
+    out = bytearray((COMPACT_V1,))
+    out += UUID(data.invoice_id).bytes
+    _write_varint(data.amount, out)
+    _write_varint(data.timestamp, out)
+    out += nonce
+    return _b64encode(bytes(out))
+
+
+def decode_fingerprint(fp_b64: str) -> FingerprintData:
+    """Parse a legacy or compact fingerprint; raise ValueError when malformed."""
+
+    try:
+        raw = _b64decode(fp_b64)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Fingerprint is not valid base64url") from exc
+    if not raw:
+        raise ValueError("Empty fingerprint")
+
+    if raw[0] == COMPACT_V1:
+        if len(raw) < 1 + 16 + 2 + COMPACT_NONCE_BYTES:
+            raise ValueError("Compact fingerprint too short")
+        invoice_id = str(UUID(bytes=raw[1:17]))
+        amount, idx = _read_varint(raw, 17)
+        timestamp, idx = _read_varint(raw, idx)
+        nonce = raw[idx:]
+        if len(nonce) != COMPACT_NONCE_BYTES:
+            raise ValueError("Compact fingerprint nonce has wrong length")
+        return FingerprintData(
+            invoice_id=invoice_id,
+            amount=amount,
+            timestamp=timestamp,
+            nonce=_b64encode(nonce),
+            algorithm=ALG_COMPACT_V1,
+        )
+
+    try:
+        invoice_id, merchant_id, amount, timestamp, nonce = raw.decode("utf-8").split("|")
+        return FingerprintData(
+            invoice_id=invoice_id,
+            merchant_id=merchant_id,
+            amount=int(amount),
+            timestamp=int(timestamp),
+            nonce=nonce,
+            algorithm=ALG_LEGACY,
+        )
+    except (UnicodeDecodeError, ValueError) as exc:
+        raise ValueError("Malformed legacy fingerprint") from exc
+
+
+def sign_fingerprint(fp_b64: str, secret: str, algorithm: str = ALG_LEGACY) -> str:
+    """Return the hex HMAC-SHA256 of ``fp_b64``, truncated for compact formats."""
+
+    digest = hmac.new(secret.encode(), fp_b64.encode(), sha256).digest()
+    if algorithm == ALG_COMPACT_V1:
+        digest = digest[:COMPACT_MAC_BYTES]
+    return digest.hex()
+
+
+def verify_signature(fp_b64: str, signature_hex: str, secret: str, algorithm: str = ALG_LEGACY) -> bool:
+    """Constant-time check of a fingerprint signature."""
+
+    expected = sign_fingerprint(fp_b64, secret, algorithm)
+    return hmac.compare_digest(signature_hex.lower().encode(), expected.encode())
+
+
+def verify_fingerprint(fp_b64: str, signature_hex: str, secret: str) -> FingerprintData:
+    """Decode and authenticate a fingerprint in either format.
+
+    Raises ValueError when it is malformed and SignatureError when the HMAC fails.
+    Shared by the scan API and the offline verifier so both apply the same rules.
+    """
+
+    data = decode_fingerprint(fp_b64)
+    if not verify_signature(fp_b64, signature_hex, secret, data.algorithm):
+        raise SignatureError("Signature validation failed")
+    return data
@@ -10,6 +10,7 @@ from starlette.requests import Request
 from starlette.responses import Response
 
 from .monitoring import observe_request
+from .runtime_monitor import runtime_monitor
 
 logger = logging.getLogger("qriscuy.http")
 
@@ -21,6 +22,7 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         start = time.perf_counter()
         route = request.scope.get("route")
         route_path = route.path if route else request.url.path
+        runtime_monitor.request_started()
         try:
             response = await call_next(request)
         except Exception:
@@ -36,6 +38,8 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             )
             observe_request(request.method, route_path, 500, duration_ms)
             raise
+        finally:
+            runtime_monitor.request_finished()
 
         duration_ms = (time.perf_counter() - start) * 1000
         level = logging.INFO
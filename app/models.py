@@ -3,13 +3,19 @@ from __future__ import annotations
 
 import enum
 from datetime import datetime, timezone
-from uuid import uuid4
+from hashlib import sha256
+from pathlib import Path
+from uuid import UUID, uuid4
 
-from sqlalchemy import DateTime, Enum as SqlEnum, ForeignKey, Integer, String, Text
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import Column, DateTime, Enum as SqlEnum, ForeignKey, Index, Integer, LargeBinary, String, Text, inspect, make_url
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 from .config import settings
+from .runtime_monitor import timed_pool_class, track_pool_capacity
 
 
 class Base(DeclarativeBase):
@@ -29,8 +35,36 @@ class InvoicePolicy(str, enum.Enum):
     SAFE = "SAFE"
 
 
+class MerchantTemplate(Base):
+    """Validated base QRIS payload, content-addressed by SHA-256 of the normalized payload."""
+
+    __tablename__ = "merchant_templates"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    merchant_name: Mapped[str] = mapped_column(String(64), nullable=False)
+    merchant_city: Mapped[str] = mapped_column(String(64), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+
+class Merchant(Base):
+    __tablename__ = "merchants"
+
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    template_id: Mapped[str] = mapped_column(ForeignKey("merchant_templates.id"), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+    template: Mapped[MerchantTemplate] = relationship()
+
+
 class Invoice(Base):
     __tablename__ = "invoices"
+    # Composite indexes back keyset pagination on (created_at, id) per filter.
+    __table_args__ = (
+        Index("ix_invoices_created_at_id", "created_at", "id"),
+        Index("ix_invoices_merchant_created_at_id", "merchant_id", "created_at", "id"),
+        Index("ix_invoices_status_created_at_id", "status", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid4()))
     merchant_id: Mapped[str] = mapped_column(String(64), nullable=False)
@@ -38,7 +72,10 @@ class Invoice(Base):
     currency: Mapped[str] = mapped_column(String(3), default="IDR")
     status: Mapped[InvoiceStatus] = mapped_column(SqlEnum(InvoiceStatus), default=InvoiceStatus.CREATED)
     policy: Mapped[InvoicePolicy] = mapped_column(SqlEnum(InvoicePolicy), default=InvoicePolicy.SAFE)
-    merchant_payload: Mapped[str] = mapped_column(Text, nullable=False)
+    # Inline payload is only set on rows created before the template registry.
+    merchant_payload: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # No foreign key: templates live on the catalog shard, invoices on every shard.
+    template_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -62,6 +99,10 @@ class Fingerprint(Base):
 
 class ScanEvent(Base):
     __tablename__ = "scan_events"
+    __table_args__ = (
+        Index("ix_scan_events_created_at_id", "created_at", "id"),
+        Index("ix_scan_events_invoice_id", "invoice_id"),
+    )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid4()))
     invoice_id: Mapped[str] = mapped_column(ForeignKey("invoices.id", ondelete="CASCADE"))
@@ -72,17 +113,147 @@ class ScanEvent(Base):
     invoice: Mapped[Invoice] = relationship(back_populates="scan_events")
 
 
-engine = create_async_engine(settings.database_url, future=True)
-SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    merchant_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[int] = mapped_column(Integer, nullable=False)
+    body: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    media_type: Mapped[str] = mapped_column(String(64), nullable=False, default="application/json", server_default="application/json")
+    expires_at: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+
+
+# Shard 0 is DATABASE_URL itself and keeps the catalog tables (templates, merchants);
+# invoices, fingerprints, scan events and idempotency keys are partitioned by merchant.
+CATALOG_SHARD = 0
+_SHARD_BITS = 16
+_SHARD_SHIFT = 128 - _SHARD_BITS
+
+
+def shard_urls(database_url: str, count: int) -> list[URL]:
+    """Shard 0 is ``database_url``; shard N is ``<name>-shardN<suffix>`` next to it."""
+
+    url = make_url(database_url)
+    if count == 1:
+        return [url]
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        raise ValueError("DATABASE_SHARDS > 1 requires a file-based SQLite DATABASE_URL")
+    path = Path(url.database)
+    return [url] + [url.set(database=str(path.with_name(f"{path.stem}-shard{index}{path.suffix}"))) for index in range(1, count)]
+
+
+class ShardRouter:
+    """One engine and session factory per database shard.
+
+    Merchants map to a shard by a stable hash of their id. Invoice ids minted
+    on a sharded deployment are UUIDv8 values whose top 16 bits hold the shard
+    index, so lookups by invoice id go straight to the right file; plain UUIDv4
+    ids predate sharding and live on shard 0.
+    """
+
+    def __init__(self, urls: list[URL]):
+        if len(urls) > 1 << _SHARD_BITS:
+            raise ValueError("Too many shards")
+        self.engines: list[AsyncEngine] = [
+            create_async_engine(url, future=True, poolclass=timed_pool_class(url)) for url in urls
+        ]
+        self.session_factories = [
+            async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession) for engine in self.engines
+        ]
+        for engine in self.engines:
+            track_pool_capacity(engine.sync_engine.pool)
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    def session(self, shard: int) -> AsyncSession:
+        return self.session_factories[shard]()
+
+    def for_merchant(self, merchant_id: str) -> int:
+        if len(self) == 1:
+            return CATALOG_SHARD
+        digest = sha256(merchant_id.encode()).digest()
+        return int.from_bytes(digest[:8], "big") % len(self)
+
+    def for_invoice(self, invoice_id: str | UUID) -> int:
+        """Shard holding ``invoice_id``; raises ``ValueError`` for ids no shard can hold."""
+
+        value = invoice_id if isinstance(invoice_id, UUID) else UUID(invoice_id)
+        if value.version != 8:
+            return CATALOG_SHARD
+        shard = value.int >> _SHARD_SHIFT
+        if shard >= len(self):
+            raise ValueError(f"Invoice id points at unknown shard {shard}")
+        return shard
+
+    def new_invoice_id(self, shard: int) -> str:
+        if len(self) == 1:
+            return str(uuid4())
+        # Keep uuid4's random bits and RFC 4122 variant; set version 8 and the shard hint.
+        value = uuid4().int & ~(((1 << _SHARD_BITS) - 1) << _SHARD_SHIFT) & ~(0xF << 76)
+        return str(UUID(int=value | (shard << _SHARD_SHIFT) | (8 << 76)))
+
+
+shards = ShardRouter(shard_urls(settings.database_url, settings.database_shards))
+engine = shards.engines[CATALOG_SHARD]
+SessionLocal = shards.session_factories[CATALOG_SHARD]
+
+
+def _upgrade_schema(sync_conn) -> None:
+    """Bring older databases up to date; batch mode rebuilds the table on SQLite."""
+
+    inspector = inspect(sync_conn)
+    operations = Operations(MigrationContext.configure(sync_conn))
+
+    columns = {column["name"]: column for column in inspector.get_columns("invoices")}
+    if "template_id" not in columns or not columns["merchant_payload"]["nullable"]:
+        with operations.batch_alter_table("invoices") as batch:
+            if "template_id" not in columns:
+                batch.add_column(Column("template_id", String(64), nullable=True))
+            batch.alter_column("merchant_payload", existing_type=Text(), nullable=True)
+
+    if any(fk["referred_table"] == "merchant_templates" for fk in inspect(sync_conn).get_foreign_keys("invoices")):
+        # SQLite cannot drop an unnamed constraint; rebuild the table from the model.
+        with operations.batch_alter_table("invoices", copy_from=Invoice.__table__, recreate="always"):
+            pass
+
+    columns = {column["name"] for column in inspector.get_columns("idempotency_keys")}
+    if "merchant_id" not in columns:
+        # Keys became (merchant_id, key); old rows cannot be attributed to a merchant
+        # and expire within IDEMPOTENCY_TTL_SEC anyway, so the table is recreated.
+        IdempotencyRecord.__table__.drop(sync_conn)
+        IdempotencyRecord.__table__.create(sync_conn)
+    elif "media_type" not in columns:
+        operations.add_column(
+            "idempotency_keys",
+            Column("media_type", String(64), nullable=False, server_default="application/json"),
+        )
+
+
+def _create_indexes(sync_conn) -> None:
+    # create_all skips existing tables entirely, so add new indexes explicitly.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 
 async def init_db() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # Every shard gets the full schema so the catalog shard needs no special casing.
+    for shard_engine in shards.engines:
+        async with shard_engine.begin() as conn:
+            if shard_engine.dialect.name == "sqlite":
+                # Only takes effect on a fresh database file; lets retention reclaim
+                # pages with PRAGMA incremental_vacuum instead of a full VACUUM.
+                await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_upgrade_schema)
+            await conn.run_sync(_create_indexes)
 
 
 async def get_session() -> AsyncSession:
-    """Provide AsyncSession for FastAPI dependency."""
+    """Provide a catalog-shard AsyncSession for FastAPI dependency."""
 
     async with SessionLocal() as session:
         yield session
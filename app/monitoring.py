@@ -1,9 +1,10 @@
 """Monitoring helpers and Prometheus metrics exporters."""
 from __future__ import annotations
 
+import time
 from typing import Final
 
-from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
 
 _HTTP_REQUEST_TOTAL: Final = Counter(
     "qriscuy_http_requests_total",
@@ -22,6 +23,83 @@ _SERVICE_ERRORS_TOTAL: Final = Counter(
     labelnames=("code", "route"),
 )
 
+_QR_VERSION: Final = Histogram(
+    "qriscuy_qr_version",
+    "QR symbol version chosen by the planner",
+    labelnames=("ec_level",),
+    buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 12, 14, 16, 20, 25, 30, 40),
+)
+
+_ADMISSION_REJECTED_TOTAL: Final = Counter(
+    "qriscuy_admission_rejected_total",
+    "Requests rejected by admission control",
+    labelnames=("reason",),
+)
+
+_RETENTION_ARCHIVED_TOTAL: Final = Counter(
+    "qriscuy_retention_rows_archived_total",
+    "Rows archived and deleted by retention policies",
+    labelnames=("policy",),
+)
+_RETENTION_THROUGHPUT: Final = Gauge(
+    "qriscuy_retention_throughput_rows_per_second",
+    "Archive throughput of the last retention run",
+    labelnames=("policy",),
+)
+_RETENTION_LAST_RUN: Final = Gauge(
+    "qriscuy_retention_last_run_timestamp_seconds",
+    "Unix time the retention policy last completed",
+    labelnames=("policy",),
+)
+
+_IDEMPOTENCY_PURGED_TOTAL: Final = Counter(
+    "qriscuy_idempotency_keys_purged_total",
+    "Expired idempotency keys deleted by the purge task",
+)
+
+_PROFILED_REQUESTS_TOTAL: Final = Counter(
+    "qriscuy_profiled_requests_total",
+    "Requests recorded by the sampling profiler",
+    labelnames=("route",),
+)
+
+_EVENT_LOOP_LAG: Final = Histogram(
+    "qriscuy_event_loop_lag_seconds",
+    "Event-loop scheduling delay measured by the drift probe",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+_REQUESTS_IN_FLIGHT: Final = Gauge(
+    "qriscuy_http_requests_in_flight",
+    "HTTP requests currently being processed",
+)
+_DB_POOL_CHECKOUT: Final = Histogram(
+    "qriscuy_db_pool_checkout_seconds",
+    "Time spent obtaining a database connection from the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+_DB_POOL_CHECKED_OUT: Final = Gauge(
+    "qriscuy_db_pool_checked_out",
+    "Database connections currently checked out",
+)
+_DB_POOL_UTILIZATION: Final = Gauge(
+    "qriscuy_db_pool_utilization",
+    "Checked-out connections divided by pool capacity (bounded pools only)",
+)
+_EXECUTOR_QUEUE_DEPTH: Final = Gauge(
+    "qriscuy_executor_queue_depth",
+    "Work items waiting for a worker thread",
+    labelnames=("executor",),
+)
+_EXECUTOR_BUSY: Final = Gauge(
+    "qriscuy_executor_busy_workers",
+    "Worker threads currently running a task",
+    labelnames=("executor",),
+)
+_READY: Final = Gauge(
+    "qriscuy_ready",
+    "1 when every saturation check passes, 0 otherwise",
+)
+
 
 def observe_request(method: str, route: str, status_code: int, duration_ms: float) -> None:
     _HTTP_REQUEST_TOTAL.labels(method=method, route=route, status=str(status_code)).inc()
@@ -32,6 +110,58 @@ def record_service_error(code: str, route: str) -> None:
     _SERVICE_ERRORS_TOTAL.labels(code=code, route=route).inc()
 
 
+def observe_qr_version(version: int, ec_level: str) -> None:
+    _QR_VERSION.labels(ec_level=ec_level).observe(version)
+
+
+def record_admission_rejection(reason: str) -> None:
+    _ADMISSION_REJECTED_TOTAL.labels(reason=reason).inc()
+
+
+def observe_retention_batch(policy: str, rows: int) -> None:
+    _RETENTION_ARCHIVED_TOTAL.labels(policy=policy).inc(rows)
+
+
+def observe_retention_run(policy: str, rows: int, seconds: float) -> None:
+    _RETENTION_THROUGHPUT.labels(policy=policy).set(rows / seconds if seconds > 0 else 0)
+    _RETENTION_LAST_RUN.labels(policy=policy).set(time.time())
+
+
+def record_idempotency_purged(rows: int) -> None:
+    _IDEMPOTENCY_PURGED_TOTAL.inc(rows)
+
+
+def record_profile(route: str) -> None:
+    _PROFILED_REQUESTS_TOTAL.labels(route=route).inc()
+
+
+def observe_loop_lag(seconds: float) -> None:
+    _EVENT_LOOP_LAG.observe(seconds)
+
+
+def set_in_flight(count: int) -> None:
+    _REQUESTS_IN_FLIGHT.set(count)
+
+
+def observe_db_checkout(seconds: float) -> None:
+    _DB_POOL_CHECKOUT.observe(seconds)
+
+
+def set_db_pool(checked_out: int, utilization: float | None) -> None:
+    _DB_POOL_CHECKED_OUT.set(checked_out)
+    if utilization is not None:
+        _DB_POOL_UTILIZATION.set(utilization)
+
+
+def set_executor(executor: str, queue_depth: int, busy: int) -> None:
+    _EXECUTOR_QUEUE_DEPTH.labels(executor=executor).set(queue_depth)
+    _EXECUTOR_BUSY.labels(executor=executor).set(busy)
+
+
+def set_ready(ready: bool) -> None:
+    _READY.set(1 if ready else 0)
+
+
 def metrics_payload() -> tuple[bytes, str]:
     """Return Prometheus exposition payload and content type."""
 
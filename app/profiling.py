@@ -0,0 +1,265 @@
+"""On-demand sampling profiler with collapsed-stack (flamegraph) output.
+
+A background thread samples ``sys._current_frames()`` at a fixed interval and
+only runs while something is being profiled. Per-request profiles attribute a
+sample to a request when that request's middleware frame is on the sampled
+stack, so interleaved coroutines on the event loop are kept apart and CPU work
+done inline (such as QR rendering) is charged to the route that did it.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import settings
+from .monitoring import record_profile
+from .services.errors import err_profiler_busy
+
+
+def _label(frame: FrameType) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+@dataclass(slots=True)
+class _Target:
+    samples: Counter[str] = field(default_factory=Counter)
+    active: bool = True
+
+
+class StackSampler:
+    """Wall-clock stack sampler; idle (blocked on an event) when nothing is registered."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        # id(frame) -> target; the frame stays alive while registered, so ids are not reused.
+        self._requests: dict[int, _Target] = {}
+        self._captures: list[_Target] = []
+
+    def register_frame(self, frame: FrameType) -> _Target:
+        target = _Target()
+        with self._lock:
+            self._requests[id(frame)] = target
+            self._start()
+        return target
+
+    def unregister_frame(self, frame: FrameType) -> None:
+        with self._lock:
+            target = self._requests.pop(id(frame), None)
+            if target is not None:
+                target.active = False
+
+    def start_capture(self) -> _Target:
+        target = _Target()
+        with self._lock:
+            self._captures.append(target)
+            self._start()
+        return target
+
+    def stop_capture(self, target: _Target) -> None:
+        with self._lock:
+            self._captures.remove(target)
+            target.active = False
+
+    def _start(self) -> None:
+        # Caller holds the lock.
+        self._wakeup.set()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="qriscuy-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                idle = not self._requests and not self._captures
+                if idle:
+                    self._wakeup.clear()
+            if idle:
+                self._wakeup.wait()
+                continue
+            time.sleep(self.interval)
+            self._sample()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        frames = sys._current_frames()
+        with self._lock:
+            requests = dict(self._requests)
+            captures = list(self._captures)
+
+        hits: list[tuple[_Target, str]] = []
+        names = {thread.ident: thread.name for thread in threading.enumerate()} if captures else {}
+        for thread_id, leaf in frames.items():
+            if thread_id == own:
+                continue
+            labels: list[str] = []
+            owner: _Target | None = None
+            owner_depth = 0
+            frame: FrameType | None = leaf
+            while frame is not None:
+                labels.append(_label(frame))
+                if owner is None:
+                    owner = requests.get(id(frame))
+                    if owner is not None:
+                        owner_depth = len(labels)
+                        if not captures:
+                            break
+                frame = frame.f_back
+            if owner is not None:
+                hits.append((owner, ";".join(reversed(labels[:owner_depth]))))
+            if captures:
+                stack = ";".join([f"thread:{names.get(thread_id, thread_id)}", *reversed(labels)])
+                hits.extend((capture, stack) for capture in captures)
+
+        with self._lock:
+            for target, stack in hits:
+                if target.active:
+                    target.samples[stack] += 1
+
+
+@dataclass(slots=True)
+class ProfileRecord:
+    route: str
+    method: str
+    duration_ms: float
+    samples: Counter[str]
+    finished_at: float
+
+
+class ProfileStore:
+    """Bounded ring buffer of request profiles, aggregated per route on read."""
+
+    def __init__(self, size: int) -> None:
+        self._records: deque[ProfileRecord] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, record: ProfileRecord) -> None:
+        with self._lock:
+            self._records.append(record)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+    def _snapshot(self) -> list[ProfileRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> list[dict[str, Any]]:
+        routes: dict[tuple[str, str], dict[str, Any]] = {}
+        for record in self._snapshot():
+            entry = routes.setdefault(
+                (record.method, record.route),
+                {"method": record.method, "route": record.route, "requests": 0, "samples": 0, "total_ms": 0.0},
+            )
+            entry["requests"] += 1
+            entry["samples"] += sum(record.samples.values())
+            entry["total_ms"] += record.duration_ms
+        return [
+            {
+                "method": entry["method"],
+                "route": entry["route"],
+                "requests": entry["requests"],
+                "samples": entry["samples"],
+                "avg_ms": round(entry["total_ms"] / entry["requests"], 2),
+            }
+            for entry in sorted(routes.values(), key=lambda item: item["samples"], reverse=True)
+        ]
+
+    def collapsed(self, route: str | None = None) -> str:
+        """Aggregate stacks as ``frame;frame;frame count`` lines; roots are ``METHOD route``."""
+
+        stacks: Counter[str] = Counter()
+        for record in self._snapshot():
+            if route is not None and record.route != route:
+                continue
+            prefix = f"{record.method} {record.route}"
+            for stack, count in record.samples.items():
+                stacks[f"{prefix};{stack}"] += count
+        return format_collapsed(stacks)
+
+
+def format_collapsed(stacks: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+class Profiler:
+    def __init__(self, *, interval: float, sample_rate: float, buffer_size: int, header: str) -> None:
+        self.sampler = StackSampler(interval)
+        self.store = ProfileStore(buffer_size)
+        self.sample_rate = sample_rate
+        self.header = header.lower().encode("latin-1")
+        self._capture_lock = asyncio.Lock()
+
+    def wants(self, scope: Scope) -> bool:
+        """Profile on the debug header (with a valid API key) or by random sampling."""
+
+        headers = dict(scope.get("headers") or ())
+        if headers.get(self.header) and headers.get(b"x-api-key") == settings.api_key.encode():
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def capture(self, seconds: float) -> str:
+        """Sample every thread in the process for ``seconds``; one capture at a time."""
+
+        if self._capture_lock.locked():
+            raise err_profiler_busy()
+        async with self._capture_lock:
+            target = self.sampler.start_capture()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                self.sampler.stop_capture(target)
+        return format_collapsed(target.samples)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware so the handler runs under this coroutine's frame."""
+
+    def __init__(self, app: ASGIApp, profiler: Profiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.profiler.wants(scope):
+            await self.app(scope, receive, send)
+            return
+
+        frame = sys._getframe()
+        target = self.profiler.sampler.register_frame(frame)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.sampler.unregister_frame(frame)
+            route = scope.get("route")
+            route_path = route.path if route else scope["path"]
+            self.profiler.store.add(
+                ProfileRecord(
+                    route=route_path,
+                    method=scope["method"],
+                    duration_ms=(time.perf_counter() - start) * 1000,
+                    samples=target.samples,
+                    finished_at=time.time(),
+                )
+            )
+            record_profile(route_path)
+
+
+profiler = Profiler(
+    interval=settings.profiling_interval_ms / 1000,
+    sample_rate=settings.profiling_sample_rate,
+    buffer_size=settings.profiling_buffer_size,
+    header=settings.profiling_header,
+)
@@ -0,0 +1,162 @@
+"""QR symbol planner: optimal mode segmentation and error-correction policy."""
+from __future__ import annotations
+
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from qrcode import constants
+from qrcode.exceptions import DataOverflowError
+from qrcode.util import (
+    ALPHA_NUM,
+    BIT_LIMIT_TABLE,
+    MODE_8BIT_BYTE,
+    MODE_ALPHA_NUM,
+    MODE_NUMBER,
+    MODE_SIZE_LARGE,
+    MODE_SIZE_MEDIUM,
+    MODE_SIZE_SMALL,
+    QRData,
+)
+
+from .config import settings
+
+EC_LEVELS: dict[str, int] = {
+    "L": constants.ERROR_CORRECT_L,
+    "M": constants.ERROR_CORRECT_M,
+    "Q": constants.ERROR_CORRECT_Q,
+    "H": constants.ERROR_CORRECT_H,
+}
+_EC_ORDER = ("L", "M", "Q", "H")
+
+# (first version, last version, character-count bit sizes) per QR version group.
+_VERSION_GROUPS = ((1, 9, MODE_SIZE_SMALL), (10, 26, MODE_SIZE_MEDIUM), (27, 40, MODE_SIZE_LARGE))
+_MODES = (MODE_NUMBER, MODE_ALPHA_NUM, MODE_8BIT_BYTE)
+# Per-character cost in sixths of a bit: numeric 10/3, alphanumeric 11/2, byte 8.
+_CHAR_COST = {MODE_NUMBER: 20, MODE_ALPHA_NUM: 33, MODE_8BIT_BYTE: 48}
+_DIGITS = frozenset(b"0123456789")
+_ALNUM = frozenset(ALPHA_NUM)
+_INF = float("inf")
+
+
+@dataclass(frozen=True)
+class QRPlan:
+    segments: tuple[QRData, ...]
+    error_correction: str
+    version: int
+    data_bits: int
+
+    @property
+    def modules(self) -> int:
+        """Symbol width/height in modules, excluding the quiet zone."""
+
+        return 17 + 4 * self.version
+
+    @property
+    def ec_constant(self) -> int:
+        return EC_LEVELS[self.error_correction]
+
+
+def _can_encode(byte: int, mode: int) -> bool:
+    if mode == MODE_NUMBER:
+        return byte in _DIGITS
+    if mode == MODE_ALPHA_NUM:
+        return byte in _ALNUM
+    return True
+
+
+def _segment(data: bytes, mode_sizes: dict[int, int]) -> list[tuple[int, bytes]]:
+    """Return the bit-optimal (mode, chunk) split for one character-count size table."""
+
+    if not data:
+        return [(MODE_8BIT_BYTE, b"")]
+
+    head = {mode: (4 + mode_sizes[mode]) * 6 for mode in _MODES}
+    prev: dict[int, float] = dict(head)
+    choices: list[dict[int, int]] = []
+    for byte in data:
+        encoded = {mode: prev[mode] + _CHAR_COST[mode] for mode in _MODES if _can_encode(byte, mode)}
+        # cur[m] is the cheapest cost of being in mode m after this character;
+        # chosen[m] is the mode the character itself was encoded in.
+        cur = dict(encoded)
+        chosen = {mode: mode for mode in encoded}
+        for target in _MODES:
+            for source, cost in encoded.items():
+                switched = (cost + 5) // 6 * 6 + head[target]
+                if switched < cur.get(target, _INF):
+                    cur[target] = switched
+                    chosen[target] = source
+        choices.append(chosen)
+        prev = {mode: cur.get(mode, _INF) for mode in _MODES}
+
+    state = min(_MODES, key=lambda mode: prev[mode])
+    per_char: list[int] = []
+    for chosen in reversed(choices):
+        state = chosen[state]
+        per_char.append(state)
+    per_char.reverse()
+
+    segments: list[tuple[int, bytes]] = []
+    start = 0
+    for idx in range(1, len(data) + 1):
+        if idx == len(data) or per_char[idx] != per_char[start]:
+            segments.append((per_char[start], data[start:idx]))
+            start = idx
+    return segments
+
+
+def _data_bits(segments: list[tuple[int, bytes]], mode_sizes: dict[int, int]) -> int:
+    bits = 0
+    for mode, chunk in segments:
+        length = len(chunk)
+        bits += 4 + mode_sizes[mode]
+        if mode == MODE_NUMBER:
+            bits += 10 * (length // 3) + (0, 4, 7)[length % 3]
+        elif mode == MODE_ALPHA_NUM:
+            bits += 11 * (length // 2) + 6 * (length % 2)
+        else:
+            bits += 8 * length
+    return bits
+
+
+def _floor_level(logo: bool) -> str:
+    level = settings.qr_error_correction
+    if level == "auto":
+        return "H" if logo else "M"
+    return level
+
+
+def plan_qr(payload: str, *, logo: bool = False) -> QRPlan:
+    """Choose segments, version and error-correction level for ``payload``.
+
+    The floor level follows ``settings.qr_error_correction`` (``auto`` means H
+    only when a logo overlay covers part of the symbol, otherwise M). When
+    boosting is enabled the level is raised as long as the version stays the same.
+    """
+
+    data = payload.encode("utf-8")
+    floor = _floor_level(logo)
+    best: tuple[int, int, list[tuple[int, bytes]]] | None = None
+    for first, last, mode_sizes in _VERSION_GROUPS:
+        segments = _segment(data, mode_sizes)
+        bits = _data_bits(segments, mode_sizes)
+        version = bisect_left(BIT_LIMIT_TABLE[EC_LEVELS[floor]], bits, first)
+        if version <= last:
+            best = (version, bits, segments)
+            break
+    if best is None:
+        raise DataOverflowError()
+    version, bits, segments = best
+
+    level = floor
+    if settings.qr_boost_error_correction:
+        for candidate in _EC_ORDER[_EC_ORDER.index(floor) + 1 :]:
+            if BIT_LIMIT_TABLE[EC_LEVELS[candidate]][version] < bits:
+                break
+            level = candidate
+
+    return QRPlan(
+        segments=tuple(QRData(chunk, mode=mode, check_data=False) for mode, chunk in segments),
+        error_correction=level,
+        version=version,
+        data_bits=bits,
+    )
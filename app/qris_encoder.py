@@ -12,15 +12,18 @@ from .tlv import TLVItem, build_tlv, parse_tlv
 class Tag62Data:
     fingerprint_b64: str
     signature_hex: str
-    timestamp: int
-    nonce: str
+    timestamp: int | None = None
+    nonce: str | None = None
     algorithm: str | None = None
 
     def to_subitems(self) -> Iterable[TLVItem]:
         yield TLVItem(tag="01", value=self.fingerprint_b64)
         yield TLVItem(tag="02", value=self.signature_hex)
-        yield TLVItem(tag="03", value=str(self.timestamp))
-        yield TLVItem(tag="04", value=self.nonce)
+        # Compact fingerprints already embed ts/nonce, so 03/04 are optional.
+        if self.timestamp is not None:
+            yield TLVItem(tag="03", value=str(self.timestamp))
+        if self.nonce is not None:
+            yield TLVItem(tag="04", value=self.nonce)
         if self.algorithm:
             yield TLVItem(tag="05", value=self.algorithm)
 
@@ -31,6 +34,13 @@ class EncodedPayload:
     crc: str
 
 
+@dataclass(frozen=True)
+class BasePayload:
+    payload: str
+    merchant_name: str
+    merchant_city: str
+
+
 def strip_crc(base_payload: str) -> str:
     """Remove Tag 63 (CRC) from an EMV payload if present."""
 
@@ -39,15 +49,44 @@ def strip_crc(base_payload: str) -> str:
     return build_tlv(filtered)
 
 
-def inject_tag62(base_payload: str, tag62: Tag62Data) -> EncodedPayload:
-    """Attach Tag 62 data and compute CRC16-CCITT."""
+def normalize_base_payload(base_payload: str) -> BasePayload:
+    """Validate a merchant QRIS payload and drop Tag 62/63 so it can be stored once.
+
+    Raises ValueError when the TLV structure, CRC or mandatory tags are invalid.
+    """
+
+    items = list(parse_tlv(base_payload.strip()))
+    crc_item = next((item for item in items if item.tag == "63"), None)
+    if crc_item is not None:
+        body = base_payload.strip()[: -len(crc_item.value)]
+        if crc16_ccitt(body) != crc_item.value.upper():
+            raise ValueError("CRC mismatch on merchant payload")
+
+    tags = {item.tag: item.value for item in items}
+    for required in ("00", "59", "60"):
+        if required not in tags:
+            raise ValueError(f"Missing mandatory tag {required}")
+    if not any(26 <= int(tag) <= 51 for tag in tags if tag.isdigit()):
+        raise ValueError("Missing merchant account information (tags 26-51)")
+
+    kept = [item for item in items if item.tag not in {"62", "63"}]
+    return BasePayload(payload=build_tlv(kept), merchant_name=tags["59"], merchant_city=tags["60"])
+
+
+def append_tag62(normalized_payload: str, tag62: Tag62Data) -> EncodedPayload:
+    """Append Tag 62 to a payload already free of Tag 62/63 and compute the CRC."""
 
-    payload_wo_crc = strip_crc(base_payload)
-    items = [item for item in parse_tlv(payload_wo_crc) if item.tag != "62"]
     tag62_value = build_tlv(tag62.to_subitems())
-    items.append(TLVItem(tag="62", value=tag62_value))
-    payload_no_crc = build_tlv(items)
+    payload_no_crc = normalized_payload + TLVItem(tag="62", value=tag62_value).serialize()
     crc_input = f"{payload_no_crc}6304"
     crc = crc16_ccitt(crc_input)
     final_payload = f"{payload_no_crc}6304{crc}"
     return EncodedPayload(payload=final_payload, crc=crc)
+
+
+def inject_tag62(base_payload: str, tag62: Tag62Data) -> EncodedPayload:
+    """Attach Tag 62 data and compute CRC16-CCITT."""
+
+    payload_wo_crc = strip_crc(base_payload)
+    items = [item for item in parse_tlv(payload_wo_crc) if item.tag != "62"]
+    return append_tag62(build_tlv(items), tag62)
@@ -1,20 +1,23 @@
 """QR image renderer with qriscuy branding."""
 from __future__ import annotations
 
-import base64
 import io
 from typing import Any
 
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
 
+from .qr_planner import QRPlan, plan_qr
 
-def generate_qr_image(data: str, title: str = "qriscuy") -> Image.Image:
+
+def generate_qr_image(data: str, title: str = "qriscuy", plan: QRPlan | None = None) -> Image.Image:
     """Generate QR image with branded frame and label."""
 
-    qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
-    qr.add_data(data)
-    qr.make(fit=True)
+    plan = plan or plan_qr(data)
+    qr = qrcode.QRCode(version=plan.version, error_correction=plan.ec_constant, box_size=10, border=4)
+    for segment in plan.segments:
+        qr.add_data(segment)
+    qr.make(fit=False)
 
     qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGBA")
     width, height = qr_img.size
@@ -30,7 +33,8 @@ def generate_qr_image(data: str, title: str = "qriscuy") -> Image.Image:
     draw = ImageDraw.Draw(canvas)
     font = ImageFont.load_default()
     text = title.upper()
-    text_width, text_height = draw.textsize(text, font=font)
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    text_width, text_height = right - left, bottom - top
     text_x = (canvas_width - text_width) // 2
     text_y = margin + height + (label_height - text_height) // 2
     draw.rectangle(
@@ -48,12 +52,13 @@ def qr_image_to_png_bytes(image: Image.Image) -> bytes:
     return buffer.getvalue()
 
 
-def render_qr_payload(payload: str, title: str = "qriscuy") -> dict[str, Any]:
-    """Render payload into PNG bytes and base64 string."""
+def render_qr_payload(payload: str, title: str = "qriscuy", logo: bool = False) -> dict[str, Any]:
+    """Render payload into PNG bytes; base64 is left to the JSON serializer."""
 
-    image = generate_qr_image(payload, title=title)
+    plan = plan_qr(payload, logo=logo)
+    image = generate_qr_image(payload, title=title, plan=plan)
     png_bytes = qr_image_to_png_bytes(image)
     return {
         "png_bytes": png_bytes,
-        "png_base64": base64.b64encode(png_bytes).decode("ascii"),
+        "plan": plan,
     }
@@ -0,0 +1,97 @@
+"""Single-pass response serialization with JSON/msgpack content negotiation."""
+from __future__ import annotations
+
+import base64
+import enum
+from datetime import datetime
+from typing import Any
+from uuid import UUID
+
+import msgpack
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def _accept_q(accept: str) -> dict[str, float]:
+    """Map each media range in an Accept header to its q-value (highest wins)."""
+
+    weights: dict[str, float] = {}
+    for entry in accept.split(","):
+        media_range, *params = (part.strip() for part in entry.split(";"))
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        media_range = media_range.lower()
+        weights[media_range] = max(q, weights.get(media_range, 0.0))
+    return weights
+
+
+def negotiate(request: Request) -> str:
+    """Pick msgpack when the client explicitly accepts it at least as much as JSON.
+
+    Wildcards count towards JSON only; ``q=0`` means "not acceptable".
+    """
+
+    weights = _accept_q(request.headers.get("accept", ""))
+    msgpack_q = max((weights.get(media_type, 0.0) for media_type in _MSGPACK_TYPES), default=0.0)
+    json_q = max(weights.get(JSON, 0.0), weights.get("application/*", 0.0), weights.get("*/*", 0.0))
+    if msgpack_q > 0 and msgpack_q >= json_q:
+        return MSGPACK
+    return JSON
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Unserializable value {type(value)!r}")
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Unserializable value {type(value)!r}")
+
+
+def encode_body(content: Any, media_type: str) -> bytes:
+    """Serialize trusted internal data once; no Pydantic validation pass.
+
+    Raw ``bytes`` values stay binary in msgpack and become base64 in JSON.
+    """
+
+    if media_type == MSGPACK:
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True, datetime=False)
+    return orjson.dumps(content, default=_json_default)
+
+
+def respond(
+    request: Request,
+    content: Any,
+    *,
+    status_code: int = 200,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    media_type = negotiate(request)
+    return Response(
+        content=encode_body(content, media_type),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -0,0 +1,42 @@
+"""Admin endpoints for the sampling profiler."""
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response
+
+from ..config import settings
+from ..dependencies import require_api_key
+from ..profiling import profiler
+from ..responses import respond
+from ..schemas import ProfileSummaryResponse
+
+router = APIRouter(tags=["admin"], dependencies=[Depends(require_api_key)])
+
+
+@router.get("/v1/admin/profiles", response_model=ProfileSummaryResponse)
+async def profile_summary(request: Request) -> Response:
+    return respond(
+        request,
+        {
+            "enabled": settings.profiling_enabled,
+            "sample_rate": profiler.sample_rate,
+            "routes": profiler.store.summary(),
+        },
+    )
+
+
+@router.get("/v1/admin/profiles/collapsed")
+async def profile_collapsed(route: str | None = Query(default=None, description="Route path, e.g. /v1/qr")) -> Response:
+    return Response(content=profiler.store.collapsed(route), media_type="text/plain")
+
+
+@router.delete("/v1/admin/profiles", status_code=204)
+async def profile_clear() -> Response:
+    profiler.store.clear()
+    return Response(status_code=204)
+
+
+@router.post("/v1/admin/profile/capture")
+async def profile_capture(seconds: float = Query(default=10, gt=0)) -> Response:
+    collapsed = await profiler.capture(min(seconds, settings.profiling_max_capture_sec))
+    return Response(content=collapsed, media_type="text/plain")
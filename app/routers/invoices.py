@@ -0,0 +1,124 @@
+"""Invoice lookup, confirmation, listing and export endpoints."""
+from __future__ import annotations
+
+from datetime import datetime
+from typing import AsyncIterator, Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..dependencies import require_api_key
+from ..models import Invoice, InvoicePolicy, InvoiceStatus, shards
+from ..responses import respond
+from ..schemas import (
+    ConfirmRequest,
+    ConfirmResponse,
+    InvoiceListResponse,
+    InvoiceStatusResponse,
+    PolicyEnum,
+    StatusEnum,
+)
+from ..services.invoices import InvoiceFilter, export_csv, export_ndjson, list_invoices
+
+router = APIRouter(tags=["invoices"], dependencies=[Depends(require_api_key)])
+
+
+def invoice_filter(
+    merchant_id: str | None = Query(default=None, max_length=64),
+    invoice_status: StatusEnum | None = Query(default=None, alias="status"),
+    policy: PolicyEnum | None = None,
+    created_from: datetime | None = Query(default=None, description="Inclusive lower bound on created_at"),
+    created_to: datetime | None = Query(default=None, description="Exclusive upper bound on created_at"),
+) -> InvoiceFilter:
+    return InvoiceFilter(
+        merchant_id=merchant_id,
+        status=InvoiceStatus(invoice_status.value) if invoice_status else None,
+        policy=InvoicePolicy(policy.value) if policy else None,
+        created_from=created_from,
+        created_to=created_to,
+    )
+
+
+@router.get("/v1/invoices", response_model=InvoiceListResponse)
+async def list_invoices_endpoint(
+    request: Request,
+    filters: InvoiceFilter = Depends(invoice_filter),
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: str | None = None,
+) -> Response:
+    page = await list_invoices(filters, limit=limit, cursor=cursor)
+    return respond(request, {"items": page.items, "next_cursor": page.next_cursor})
+
+
+@router.get("/v1/invoices/export")
+async def export_invoices(
+    filters: InvoiceFilter = Depends(invoice_filter),
+    export_format: Literal["ndjson", "csv"] = Query(default="ndjson", alias="format"),
+) -> StreamingResponse:
+    if export_format == "csv":
+        body = export_csv(filters, chunk_size=settings.export_chunk_size)
+        media_type = "text/csv"
+    else:
+        body = export_ndjson(filters, chunk_size=settings.export_chunk_size)
+        media_type = "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type)
+
+
+async def invoice_session(invoice_id: UUID) -> AsyncIterator[AsyncSession]:
+    """Provide a session on the shard encoded in the invoice id."""
+
+    try:
+        shard = shards.for_invoice(invoice_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Invoice not found") from None
+    async with shards.session(shard) as session:
+        yield session
+
+
+@router.get("/v1/invoices/{invoice_id}", response_model=InvoiceStatusResponse)
+async def get_invoice(invoice_id: UUID, request: Request, session: AsyncSession = Depends(invoice_session)) -> Response:
+    stmt = select(Invoice).where(Invoice.id == str(invoice_id)).limit(1)
+    result = await session.execute(stmt)
+    invoice = result.scalars().first()
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+
+    return respond(
+        request,
+        {
+            "invoice_id": invoice.id,
+            "status": invoice.status.value,
+            "policy": invoice.policy.value,
+            "amount": invoice.amount,
+            "currency": invoice.currency,
+            "merchant_id": invoice.merchant_id,
+        },
+    )
+
+
+@router.post("/v1/invoices/{invoice_id}/confirm", response_model=ConfirmResponse)
+async def confirm_invoice(
+    invoice_id: UUID,
+    payload: ConfirmRequest,
+    request: Request,
+    session: AsyncSession = Depends(invoice_session),
+) -> Response:
+    stmt = select(Invoice).where(Invoice.id == str(invoice_id)).limit(1)
+    result = await session.execute(stmt)
+    invoice = result.scalars().first()
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+
+    if payload.action == "SUCCESS":
+        invoice.status = InvoiceStatus.SUCCESS
+    else:
+        invoice.status = InvoiceStatus.REJECTED
+
+    await session.commit()
+    await session.refresh(invoice)
+
+    return respond(request, {"invoice_id": invoice.id, "status": invoice.status.value})
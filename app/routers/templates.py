@@ -0,0 +1,62 @@
+"""Merchant template registry endpoints."""
+from __future__ import annotations
+
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..dependencies import require_api_key
+from ..models import MerchantTemplate, get_session
+from ..responses import respond
+from ..schemas import MerchantResponse, MerchantTemplateRequest, TemplateRegisterRequest, TemplateResponse
+from ..services.templates import TemplateService
+
+router = APIRouter(tags=["templates"], dependencies=[Depends(require_api_key)])
+
+
+def _template_content(template: MerchantTemplate, created: bool = False) -> dict[str, Any]:
+    return {
+        "template_id": template.id,
+        "merchant_name": template.merchant_name,
+        "merchant_city": template.merchant_city,
+        "created": created,
+    }
+
+
+@router.post("/v1/templates", response_model=TemplateResponse)
+async def register_template(
+    payload: TemplateRegisterRequest,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> Response:
+    result = await TemplateService(session).register(payload.merchant_payload)
+    return respond(request, _template_content(result.template, created=result.created))
+
+
+@router.get("/v1/templates/{template_id}", response_model=TemplateResponse)
+async def get_template(template_id: str, request: Request, session: AsyncSession = Depends(get_session)) -> Response:
+    template = await session.get(MerchantTemplate, template_id)
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return respond(request, _template_content(template))
+
+
+@router.put("/v1/merchants/{merchant_id}/template", response_model=MerchantResponse)
+async def set_merchant_template(
+    merchant_id: str,
+    payload: MerchantTemplateRequest,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> Response:
+    service = TemplateService(session)
+    if payload.template_id is not None:
+        template = await service.get(payload.template_id)
+    else:
+        template = (await service.register(payload.merchant_payload)).template
+    merchant = await service.assign(merchant_id, template)
+    return respond(
+        request,
+        {"merchant_id": merchant.id, "template_id": merchant.template_id, "updated_at": merchant.updated_at},
+    )
@@ -0,0 +1,168 @@
+"""Runtime saturation signals: event-loop lag, in-flight requests, DB pool and executors.
+
+The monitor feeds ``/metrics`` and decides readiness for ``/ready``. Peaks are
+kept over a short sliding window so a single stall keeps the node unready long
+enough for a load balancer probe to notice.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any
+
+from anyio.to_thread import current_default_thread_limiter
+from sqlalchemy.engine import URL
+from sqlalchemy.pool import Pool, QueuePool
+
+from .config import settings
+from .monitoring import (
+    observe_db_checkout,
+    observe_loop_lag,
+    set_db_pool,
+    set_executor,
+    set_in_flight,
+    set_ready,
+)
+
+logger = logging.getLogger("qriscuy.runtime")
+
+
+class _PeakWindow:
+    """Maximum of the values observed during the last ``seconds``."""
+
+    def __init__(self, seconds: float) -> None:
+        self.seconds = seconds
+        self._values: deque[tuple[float, float]] = deque()
+
+    def add(self, value: float) -> None:
+        now = time.monotonic()
+        self._values.append((now, value))
+        self._prune(now)
+
+    def peak(self) -> float:
+        self._prune(time.monotonic())
+        return max((value for _, value in self._values), default=0.0)
+
+    def _prune(self, now: float) -> None:
+        while self._values and now - self._values[0][0] > self.seconds:
+            self._values.popleft()
+
+
+class RuntimeMonitor:
+    def __init__(self, *, window_sec: float, probe_interval: float) -> None:
+        self.probe_interval = probe_interval
+        self.in_flight = 0
+        self.db_checked_out = 0
+        self.db_capacity: int | None = None
+        self.loop_lag = _PeakWindow(window_sec)
+        self.db_checkout = _PeakWindow(window_sec)
+        self.executor_queue = _PeakWindow(window_sec)
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+        set_in_flight(self.in_flight)
+
+    def request_finished(self) -> None:
+        self.in_flight -= 1
+        set_in_flight(self.in_flight)
+
+    def connection_checked_out(self, seconds: float) -> None:
+        self.db_checked_out += 1
+        self.db_checkout.add(seconds)
+        observe_db_checkout(seconds)
+
+    def connection_checked_in(self) -> None:
+        self.db_checked_out = max(0, self.db_checked_out - 1)
+
+    @property
+    def db_utilization(self) -> float | None:
+        if not self.db_capacity:
+            return None
+        return self.db_checked_out / self.db_capacity
+
+    async def run(self) -> None:
+        """Drift probe: sleep for a fixed period and record how late the loop woke us."""
+
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.probe_interval)
+            lag = max(0.0, loop.time() - start - self.probe_interval)
+            self.loop_lag.add(lag)
+            observe_loop_lag(lag)
+            try:
+                self._sample_executors(loop)
+                set_db_pool(self.db_checked_out, self.db_utilization)
+                set_ready(self.readiness()[0])
+            except Exception:
+                logger.exception("runtime probe failed")
+
+    def _sample_executors(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Starlette runs sync dependencies and endpoints through anyio's thread limiter.
+        stats = current_default_thread_limiter().statistics()
+        set_executor("anyio", stats.tasks_waiting, stats.borrowed_tokens)
+        waiting = stats.tasks_waiting
+
+        # asyncio.to_thread (retention archiving) uses the loop's default executor,
+        # which only exists once something has been submitted to it.
+        executor = getattr(loop, "_default_executor", None)
+        work_queue = getattr(executor, "_work_queue", None)
+        if work_queue is not None:
+            depth = work_queue.qsize()
+            set_executor("asyncio", depth, len(getattr(executor, "_threads", ())))
+            waiting += depth
+        self.executor_queue.add(waiting)
+
+    def readiness(self) -> tuple[bool, dict[str, dict[str, Any]]]:
+        """Compare window peaks with the configured thresholds (0 disables a check)."""
+
+        checks = {
+            "event_loop_lag_ms": (self.loop_lag.peak() * 1000, settings.ready_max_loop_lag_ms),
+            "in_flight": (self.in_flight, settings.ready_max_in_flight),
+            "db_checkout_ms": (self.db_checkout.peak() * 1000, settings.ready_max_db_checkout_ms),
+            "executor_queue": (self.executor_queue.peak(), settings.ready_max_executor_queue),
+        }
+        utilization = self.db_utilization
+        if utilization is not None:
+            checks["db_pool_utilization"] = (utilization, settings.ready_max_db_utilization)
+
+        result = {}
+        for name, (value, limit) in checks.items():
+            ok = not limit or value <= limit
+            result[name] = {"value": round(value, 3), "limit": limit, "ok": ok}
+        return all(check["ok"] for check in result.values()), result
+
+
+runtime_monitor = RuntimeMonitor(
+    window_sec=settings.ready_window_sec,
+    probe_interval=settings.runtime_probe_interval_ms / 1000,
+)
+
+
+class _TimedCheckoutPool(Pool):
+    """Mixin over the dialect's default pool that reports checkout time and occupancy."""
+
+    def _do_get(self):  # type: ignore[no-untyped-def]
+        start = time.perf_counter()
+        connection = super()._do_get()
+        runtime_monitor.connection_checked_out(time.perf_counter() - start)
+        return connection
+
+    def _do_return_conn(self, record):  # type: ignore[no-untyped-def]
+        runtime_monitor.connection_checked_in()
+        super()._do_return_conn(record)
+
+
+def timed_pool_class(url: URL) -> type[Pool]:
+    """Return the pool class the dialect would pick, instrumented for the monitor."""
+
+    base = url.get_dialect().get_pool_class(url)
+    return type(f"Timed{base.__name__}", (_TimedCheckoutPool, base), {})
+
+
+def track_pool_capacity(pool: Pool) -> None:
+    # Only QueuePool has a hard limit; NullPool/StaticPool (SQLite) report occupancy only.
+    if isinstance(pool, QueuePool) and pool._max_overflow >= 0:
+        runtime_monitor.db_capacity = (runtime_monitor.db_capacity or 0) + pool.size() + pool._max_overflow
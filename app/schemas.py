@@ -1,11 +1,12 @@
 """Pydantic schemas for API contracts."""
 from __future__ import annotations
 
+from datetime import datetime
 from enum import Enum
 from typing import Any, Literal
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class PolicyEnum(str, Enum):
@@ -13,9 +14,29 @@ class PolicyEnum(str, Enum):
     SAFE = "SAFE"
 
 
-class GenerateQRRequest(BaseModel):
+class StatusEnum(str, Enum):
+    CREATED = "CREATED"
+    SCANNED = "SCANNED"
+    SUCCESS = "SUCCESS"
+    REJECTED = "REJECTED"
+    EXPIRED = "EXPIRED"
+
+
+class _TemplateSource(BaseModel):
+    template_id: str | None = Field(default=None, min_length=64, max_length=64, description="Registered template id")
+    merchant_payload: str | None = Field(default=None, description="Base QRIS payload string")
+
+    @model_validator(mode="after")
+    def _single_source(self) -> "_TemplateSource":
+        if self.template_id is not None and self.merchant_payload is not None:
+            raise ValueError("Provide either template_id or merchant_payload, not both")
+        return self
+
+
+class GenerateQRRequest(_TemplateSource):
+    """Without template_id or merchant_payload the merchant's registered template is used."""
+
     merchant_id: str = Field(min_length=3, max_length=64)
-    merchant_payload: str = Field(description="Base QRIS payload string")
     amount: int = Field(ge=1)
     currency: str = Field(default="IDR", min_length=3, max_length=3)
     policy: PolicyEnum | None = None
@@ -31,13 +52,41 @@ class GenerateQRResponse(BaseModel):
     signature_hex: str
     timestamp: int
     nonce: str
+    qr_version: int
+    qr_modules: int
+    qr_error_correction: str
+
+
+class TemplateRegisterRequest(BaseModel):
+    merchant_payload: str = Field(description="Base QRIS payload string")
+
+
+class TemplateResponse(BaseModel):
+    template_id: str
+    merchant_name: str
+    merchant_city: str
+    created: bool = False
+
+
+class MerchantTemplateRequest(_TemplateSource):
+    @model_validator(mode="after")
+    def _required_source(self) -> "MerchantTemplateRequest":
+        if self.template_id is None and self.merchant_payload is None:
+            raise ValueError("template_id or merchant_payload is required")
+        return self
+
+
+class MerchantResponse(BaseModel):
+    merchant_id: str
+    template_id: str
+    updated_at: datetime
 
 
 class ScanRequest(BaseModel):
     fingerprint_b64: str
     signature_hex: str
-    timestamp: int
-    nonce: str
+    timestamp: int | None = None
+    nonce: str | None = None
     device_id: str | None = None
     client_meta: dict[str, Any] | None = None
 
@@ -57,6 +106,36 @@ class InvoiceStatusResponse(BaseModel):
     merchant_id: str
 
 
+class InvoiceSummary(BaseModel):
+    invoice_id: UUID
+    merchant_id: str
+    amount: int
+    currency: str
+    status: str
+    policy: PolicyEnum
+    created_at: datetime
+    updated_at: datetime
+
+
+class InvoiceListResponse(BaseModel):
+    items: list[InvoiceSummary]
+    next_cursor: str | None = None
+
+
+class ProfileRouteSummary(BaseModel):
+    method: str
+    route: str
+    requests: int
+    samples: int
+    avg_ms: float
+
+
+class ProfileSummaryResponse(BaseModel):
+    enabled: bool
+    sample_rate: float
+    routes: list[ProfileRouteSummary]
+
+
 class ConfirmRequest(BaseModel):
     action: Literal["SUCCESS", "REJECTED"]
 
@@ -1,7 +1,7 @@
 """Shared service error definitions."""
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass(slots=True)
@@ -9,6 +9,7 @@ class ServiceError(Exception):
     code: str
     message: str
     status_code: int = 400
+    headers: dict[str, str] | None = field(default=None)
 
     def __str__(self) -> str:  # noqa: D401 override
         return f"{self.code}: {self.message}"
@@ -28,3 +29,33 @@ def err_replay(message: str | None = None) -> ServiceError:
 
 def err_bad_payload(message: str | None = None) -> ServiceError:
     return ServiceError(code="ERR_BAD_PAYLOAD", message=message or "Invalid request payload", status_code=400)
+
+
+def err_idempotency_mismatch(message: str | None = None) -> ServiceError:
+    return ServiceError(
+        code="ERR_IDEMPOTENCY_KEY",
+        message=message or "Idempotency-Key reused with a different request body",
+        status_code=422,
+    )
+
+
+def err_rate_limit(message: str | None = None, *, retry_after: int = 1) -> ServiceError:
+    return ServiceError(
+        code="ERR_RATE_LIMIT",
+        message=message or "Too many requests",
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def err_overloaded(message: str | None = None, *, retry_after: int = 1) -> ServiceError:
+    return ServiceError(
+        code="ERR_OVERLOADED",
+        message=message or "Server is overloaded, retry later",
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def err_profiler_busy(message: str | None = None) -> ServiceError:
+    return ServiceError(code="ERR_PROFILER_BUSY", message=message or "A profile capture is already running", status_code=409)
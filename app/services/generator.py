@@ -1,18 +1,16 @@
 """Invoice generation and QR building services."""
 from __future__ import annotations
 
-import base64
-import hmac
-import secrets
 import time
 from dataclasses import dataclass
-from hashlib import sha256
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..config import settings
-from ..models import Fingerprint, Invoice, InvoicePolicy
-from ..qris_encoder import EncodedPayload, Tag62Data, inject_tag62
+from ..fingerprint import ALG_COMPACT_V1, FingerprintData, encode_fingerprint, new_nonce, sign_fingerprint
+from ..models import Fingerprint, Invoice, InvoicePolicy, MerchantTemplate, shards
+from ..monitoring import observe_qr_version
+from ..qris_encoder import EncodedPayload, Tag62Data, append_tag62
 from ..renderer import render_qr_payload
 
 
@@ -20,11 +18,14 @@ from ..renderer import render_qr_payload
 class GenerateResult:
     invoice: Invoice
     encoded: EncodedPayload
-    qr_png_base64: str
+    qr_png: bytes
     fingerprint_b64: str
     signature_hex: str
     timestamp: int
     nonce: str
+    qr_version: int
+    qr_modules: int
+    qr_error_correction: str
 
 
 class InvoiceGenerator:
@@ -35,36 +36,49 @@ class InvoiceGenerator:
         self,
         *,
         merchant_id: str,
-        merchant_payload: str,
+        template: MerchantTemplate,
         amount: int,
         currency: str = "IDR",
         policy: InvoicePolicy | None = None,
     ) -> GenerateResult:
+        # Assign the id up front: the column default only fires on flush, and the
+        # fingerprint must embed the real invoice id (which carries the shard hint).
+        # The caller's session is bound to the merchant's shard.
         invoice = Invoice(
+            id=shards.new_invoice_id(shards.for_merchant(merchant_id)),
             merchant_id=merchant_id,
-            merchant_payload=merchant_payload,
+            template_id=template.id,
             amount=amount,
             currency=currency,
             policy=policy or InvoicePolicy(settings.default_policy),
         )
 
+        algorithm = ALG_COMPACT_V1
         ts = int(time.time())
-        nonce = secrets.token_urlsafe(8)
-        fp_raw = f"{invoice.id}|{merchant_id}|{amount}|{ts}|{nonce}"
-        fp_b64 = base64.urlsafe_b64encode(fp_raw.encode()).decode().rstrip("=")
-
-        signature = hmac.new(settings.hmac_secret.encode(), fp_b64.encode(), sha256).hexdigest()
+        nonce = new_nonce()
+        fp_b64 = encode_fingerprint(
+            FingerprintData(
+                invoice_id=invoice.id,
+                merchant_id=merchant_id,
+                amount=amount,
+                timestamp=ts,
+                nonce=nonce,
+                algorithm=algorithm,
+            )
+        )
+        signature = sign_fingerprint(fp_b64, settings.hmac_secret, algorithm)
 
         tag62 = Tag62Data(
             fingerprint_b64=fp_b64,
             signature_hex=signature,
-            timestamp=ts,
-            nonce=nonce,
-            algorithm="HMAC-SHA256",
+            algorithm=algorithm,
         )
-        encoded_payload = inject_tag62(merchant_payload, tag62)
+        # Templates are validated and stripped of Tag 62/63 at registration.
+        encoded_payload = append_tag62(template.payload, tag62)
 
         render = render_qr_payload(encoded_payload.payload, title=settings.app_name)
+        plan = render["plan"]
+        observe_qr_version(plan.version, plan.error_correction)
 
         fingerprint = Fingerprint(
             invoice_id=invoice.id,
@@ -83,9 +97,12 @@ class InvoiceGenerator:
         return GenerateResult(
             invoice=invoice,
             encoded=encoded_payload,
-            qr_png_base64=render["png_base64"],
+            qr_png=render["png_bytes"],
             fingerprint_b64=fp_b64,
             signature_hex=signature,
             timestamp=ts,
             nonce=nonce,
+            qr_version=plan.version,
+            qr_modules=plan.modules,
+            qr_error_correction=plan.error_correction,
         )
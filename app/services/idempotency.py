@@ -0,0 +1,259 @@
+"""Idempotency-Key handling: cached responses, DB reservations and in-flight coalescing."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Awaitable, Callable, Sequence
+
+from sqlalchemy import ColumnElement, delete, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from ..config import settings
+from ..models import IdempotencyRecord, shards
+from ..monitoring import record_idempotency_purged
+from .errors import err_idempotency_mismatch
+
+logger = logging.getLogger("qriscuy.idempotency")
+
+
+@dataclass(slots=True)
+class StoredResponse:
+    request_hash: str
+    status_code: int
+    body: bytes
+    media_type: str
+    expires_at: int
+
+
+# Keys are scoped to the merchant that sent them (``(merchant_id, key)`` is the
+# table's primary key), so the cache and in-flight map use the same pair.
+CacheKey = tuple[str, str]
+
+
+class IdempotencyCache:
+    """Bounded in-memory TTL store, evicting least recently used entries."""
+
+    def __init__(self, max_entries: int, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: OrderedDict[CacheKey, StoredResponse] = OrderedDict()
+
+    def get(self, key: CacheKey) -> StoredResponse | None:
+        stored = self._entries.get(key)
+        if stored is None:
+            return None
+        if stored.expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return stored
+
+    def put(self, key: CacheKey, stored: StoredResponse) -> None:
+        self._entries[key] = stored
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+idempotency_cache = IdempotencyCache(settings.idempotency_cache_size)
+# Leader futures for keys currently being processed in this worker.
+_in_flight: dict[CacheKey, asyncio.Future[None]] = {}
+
+
+# status_code of a reserved key whose response is still being produced.
+PENDING = 0
+
+
+def hash_request(body: str) -> str:
+    return sha256(body.encode()).hexdigest()
+
+
+class IdempotencyService:
+    def __init__(self, session: AsyncSession, merchant_id: str, cache: IdempotencyCache = idempotency_cache):
+        self.session = session
+        self.merchant_id = merchant_id
+        self.cache = cache
+
+    async def execute(
+        self,
+        key: str,
+        request_hash: str,
+        produce: Callable[[], Awaitable[bytes]],
+        *,
+        media_type: str = "application/json",
+    ) -> tuple[StoredResponse, bool]:
+        """Return ``(stored, replayed)``, running ``produce`` at most once per merchant and key.
+
+        The key is reserved with a pending row before ``produce`` runs, so duplicates
+        on other workers poll for the result instead of creating a second invoice.
+        Replays carry the media type of the first response, whatever the retry accepts.
+        """
+
+        cache_key = (self.merchant_id, key)
+        while True:
+            stored = self.cache.get(cache_key) or await self._load(key)
+            if stored is not None:
+                if stored.request_hash != request_hash:
+                    raise err_idempotency_mismatch()
+                if stored.status_code != PENDING:
+                    return stored, True
+
+            leader = _in_flight.get(cache_key)
+            if leader is not None:
+                # Wait for the in-flight request, then re-check; if it failed we retry as leader.
+                await asyncio.shield(leader)
+                continue
+            if stored is None and await self._reserve(key, request_hash):
+                break
+            # Another worker holds the reservation; it completes, is released on
+            # failure, or lapses after IDEMPOTENCY_LOCK_TIMEOUT_SEC.
+            await asyncio.sleep(settings.idempotency_poll_interval_ms / 1000)
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        _in_flight[cache_key] = future
+        try:
+            try:
+                body = await produce()
+            except Exception:
+                await self._release(key)
+                raise
+            stored = StoredResponse(
+                request_hash=request_hash,
+                status_code=200,
+                body=body,
+                media_type=media_type,
+                expires_at=int(time.time()) + settings.idempotency_ttl_sec,
+            )
+            await self._complete(key, stored)
+            self.cache.put(cache_key, stored)
+            return stored, False
+        finally:
+            del _in_flight[cache_key]
+            future.set_result(None)
+
+    async def _load(self, key: str) -> StoredResponse | None:
+        # populate_existing: pollers must see the other worker's commit, not the identity map.
+        record = await self.session.get(IdempotencyRecord, (self.merchant_id, key), populate_existing=True)
+        if record is None:
+            return None
+        # Detach so a later reservation of the same key is a fresh INSERT.
+        self.session.expunge(record)
+        if record.expires_at <= int(time.time()):
+            # Conditional delete: another worker may already have re-reserved the key.
+            await self.session.execute(
+                delete(IdempotencyRecord).where(*self._match(key), IdempotencyRecord.expires_at == record.expires_at)
+            )
+            await self.session.commit()
+            return None
+        stored = StoredResponse(
+            request_hash=record.request_hash,
+            status_code=record.status_code,
+            body=record.body,
+            media_type=record.media_type,
+            expires_at=record.expires_at,
+        )
+        if stored.status_code != PENDING:
+            self.cache.put((self.merchant_id, key), stored)
+        return stored
+
+    async def _reserve(self, key: str, request_hash: str) -> bool:
+        self.session.add(
+            IdempotencyRecord(
+                merchant_id=self.merchant_id,
+                key=key,
+                request_hash=request_hash,
+                status_code=PENDING,
+                body=b"",
+                expires_at=int(time.time()) + settings.idempotency_lock_timeout_sec,
+            )
+        )
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            # Another worker reserved this key first.
+            await self.session.rollback()
+            return False
+        return True
+
+    async def _release(self, key: str) -> None:
+        await self.session.rollback()
+        await self.session.execute(
+            delete(IdempotencyRecord).where(*self._match(key), IdempotencyRecord.status_code == PENDING)
+        )
+        await self.session.commit()
+
+    async def _complete(self, key: str, stored: StoredResponse) -> None:
+        result = await self.session.execute(
+            update(IdempotencyRecord)
+            .where(*self._match(key), IdempotencyRecord.status_code == PENDING)
+            .values(
+                status_code=stored.status_code,
+                body=stored.body,
+                media_type=stored.media_type,
+                expires_at=stored.expires_at,
+            )
+        )
+        await self.session.commit()
+        if result.rowcount == 0:
+            # produce outlived IDEMPOTENCY_LOCK_TIMEOUT_SEC and the reservation lapsed;
+            # the response is still returned, but only this worker's cache remembers it.
+            logger.warning(
+                "idempotency reservation lapsed before completion",
+                extra={"merchant_id": self.merchant_id, "idempotency_key": key},
+            )
+
+    def _match(self, key: str) -> tuple[ColumnElement[bool], ColumnElement[bool]]:
+        return IdempotencyRecord.merchant_id == self.merchant_id, IdempotencyRecord.key == key
+
+
+async def purge_expired(
+    session_factories: Sequence[async_sessionmaker[AsyncSession]] | None = None,
+    *,
+    batch_size: int | None = None,
+) -> int:
+    """Delete expired keys on every shard in short batches; return the number removed."""
+
+    batch_size = batch_size or settings.idempotency_purge_batch_size
+    total = 0
+    for session_factory in session_factories or shards.session_factories:
+        while True:
+            now = int(time.time())
+            async with session_factory() as session:
+                expired = (
+                    await session.execute(
+                        select(IdempotencyRecord.merchant_id, IdempotencyRecord.key)
+                        .where(IdempotencyRecord.expires_at <= now)
+                        .limit(batch_size)
+                    )
+                ).all()
+                if expired:
+                    pk = tuple_(IdempotencyRecord.merchant_id, IdempotencyRecord.key)
+                    await session.execute(
+                        delete(IdempotencyRecord).where(pk.in_(expired), IdempotencyRecord.expires_at <= now)
+                    )
+                    await session.commit()
+            total += len(expired)
+            record_idempotency_purged(len(expired))
+            if len(expired) < batch_size:
+                break
+            # Give request handlers a chance at the write lock between batches.
+            await asyncio.sleep(0)
+    return total
+
+
+async def run_idempotency_purge_forever() -> None:
+    """Background loop started by the API; each worker running it is harmless."""
+
+    while True:
+        try:
+            rows = await purge_expired()
+            if rows:
+                logger.info("expired idempotency keys purged", extra={"rows": rows})
+        except Exception:
+            logger.exception("idempotency purge failed")
+        await asyncio.sleep(settings.idempotency_purge_interval_sec)
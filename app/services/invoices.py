@@ -0,0 +1,189 @@
+"""Invoice listing, keyset pagination and streaming export across shards."""
+from __future__ import annotations
+
+import asyncio
+import base64
+import csv
+import heapq
+import io
+import json
+from collections import deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator
+
+from sqlalchemy import Row, Select, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Invoice, InvoicePolicy, InvoiceStatus, shards
+from .errors import err_bad_payload
+
+EXPORT_FIELDS = ("invoice_id", "merchant_id", "amount", "currency", "status", "policy", "created_at", "updated_at")
+
+# Plain columns keep rows out of the identity map, so exports stay constant-memory.
+_COLUMNS = (
+    Invoice.id,
+    Invoice.merchant_id,
+    Invoice.amount,
+    Invoice.currency,
+    Invoice.status,
+    Invoice.policy,
+    Invoice.created_at,
+    Invoice.updated_at,
+)
+
+
+@dataclass(frozen=True)
+class InvoiceFilter:
+    merchant_id: str | None = None
+    status: InvoiceStatus | None = None
+    policy: InvoicePolicy | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+
+@dataclass(slots=True)
+class InvoicePage:
+    items: list[dict[str, Any]]
+    next_cursor: str | None
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite stores timestamps as naive UTC strings and drops tzinfo on bind,
+    # so bounds must already be expressed in UTC; naive input is taken as UTC.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def encode_cursor(created_at: datetime, invoice_id: str) -> str:
+    raw = json.dumps([_as_utc(created_at).isoformat(), invoice_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, invoice_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(invoice_id)
+    except (ValueError, TypeError) as exc:
+        raise err_bad_payload("Invalid cursor") from exc
+
+
+def _build_query(filters: InvoiceFilter, after: tuple[datetime, str] | None, limit: int) -> Select:
+    stmt = select(*_COLUMNS)
+    if filters.merchant_id is not None:
+        stmt = stmt.where(Invoice.merchant_id == filters.merchant_id)
+    if filters.status is not None:
+        stmt = stmt.where(Invoice.status == filters.status)
+    if filters.policy is not None:
+        stmt = stmt.where(Invoice.policy == filters.policy)
+    if filters.created_from is not None:
+        stmt = stmt.where(Invoice.created_at >= _as_utc(filters.created_from))
+    if filters.created_to is not None:
+        stmt = stmt.where(Invoice.created_at < _as_utc(filters.created_to))
+    if after is not None:
+        stmt = stmt.where(tuple_(Invoice.created_at, Invoice.id) < tuple_(_as_utc(after[0]), after[1]))
+    return stmt.order_by(Invoice.created_at.desc(), Invoice.id.desc()).limit(limit)
+
+
+def _row_to_dict(row: Row) -> dict[str, Any]:
+    return {
+        "invoice_id": row.id,
+        "merchant_id": row.merchant_id,
+        "amount": row.amount,
+        "currency": row.currency,
+        "status": row.status.value,
+        "policy": row.policy.value,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+    }
+
+
+def _sort_key(row: Row) -> tuple[datetime, str]:
+    return (_as_utc(row.created_at), row.id)
+
+
+async def _fetch(session: AsyncSession, filters: InvoiceFilter, after: tuple[datetime, str] | None, limit: int) -> list[Row]:
+    return list((await session.execute(_build_query(filters, after, limit))).all())
+
+
+async def list_invoices(filters: InvoiceFilter, *, limit: int, cursor: str | None = None) -> InvoicePage:
+    """Return one page, newest first, using (created_at, id) keyset pagination.
+
+    Every shard answers the same keyset query concurrently and the sorted
+    results are merged; the cursor is global, so pages stay stable.
+    """
+
+    after = decode_cursor(cursor) if cursor else None
+    async with AsyncExitStack() as stack:
+        sessions = [await stack.enter_async_context(factory()) for factory in shards.session_factories]
+        results = await asyncio.gather(*(_fetch(session, filters, after, limit + 1) for session in sessions))
+    rows = list(heapq.merge(*results, key=_sort_key, reverse=True))[: limit + 1]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return InvoicePage(items=[_row_to_dict(row) for row in rows], next_cursor=next_cursor)
+
+
+async def iter_invoices(filters: InvoiceFilter, *, chunk_size: int) -> AsyncIterator[list[dict[str, Any]]]:
+    """Yield invoices in keyset-ordered chunks, each read by its own short query.
+
+    Each shard is paged independently and buffered; a row is only emitted
+    while every unfinished shard has a buffered candidate, which keeps the
+    merged stream in global order with at most one chunk per shard in memory.
+    """
+
+    async with AsyncExitStack() as stack:
+        sessions = [await stack.enter_async_context(factory()) for factory in shards.session_factories]
+        buffers: list[deque[Row]] = [deque() for _ in sessions]
+        afters: list[tuple[datetime, str] | None] = [None] * len(sessions)
+        done = [False] * len(sessions)
+
+        while True:
+            refill = [index for index, buffer in enumerate(buffers) if not buffer and not done[index]]
+            fetched = await asyncio.gather(*(_fetch(sessions[index], filters, afters[index], chunk_size) for index in refill))
+            for index, rows in zip(refill, fetched):
+                buffers[index].extend(rows)
+                done[index] = len(rows) < chunk_size
+                if rows:
+                    afters[index] = (rows[-1].created_at, rows[-1].id)
+
+            chunk = []
+            while len(chunk) < chunk_size:
+                if any(not buffer and not done[index] for index, buffer in enumerate(buffers)):
+                    break
+                candidates = [buffer for buffer in buffers if buffer]
+                if not candidates:
+                    break
+                chunk.append(max(candidates, key=lambda buffer: _sort_key(buffer[0])).popleft())
+            if chunk:
+                yield [_row_to_dict(row) for row in chunk]
+            elif all(done) and not any(buffers):
+                return
+
+
+def _export_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def export_ndjson(filters: InvoiceFilter, *, chunk_size: int) -> AsyncIterator[bytes]:
+    async for chunk in iter_invoices(filters, chunk_size=chunk_size):
+        lines = (json.dumps({k: _export_value(v) for k, v in item.items()}, ensure_ascii=False) for item in chunk)
+        yield ("\n".join(lines) + "\n").encode()
+
+
+async def export_csv(filters: InvoiceFilter, *, chunk_size: int) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue().encode()
+    async for chunk in iter_invoices(filters, chunk_size=chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for item in chunk:
+            writer.writerow([_export_value(item[field]) for field in EXPORT_FIELDS])
+        yield buffer.getvalue().encode()
@@ -0,0 +1,280 @@
+"""Data retention: archive old rows to compressed NDJSON and delete them in batches."""
+from __future__ import annotations
+
+import asyncio
+import enum
+import fcntl
+import gzip
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterator, Sequence
+from uuid import uuid4
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from ..config import settings
+from ..models import Base, Fingerprint, Invoice, InvoiceStatus, ScanEvent, shards
+from ..monitoring import observe_retention_batch, observe_retention_run
+
+logger = logging.getLogger("qriscuy.retention")
+
+# Held in RETENTION_ARCHIVE_DIR for the duration of a run.
+LOCK_FILE = ".retention.lock"
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    table: str
+    days: int
+    status: InvoiceStatus | None = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.table}.{self.status.value}" if self.status else self.table
+
+
+@dataclass(slots=True)
+class RetentionReport:
+    policy: RetentionPolicy
+    rows: int
+    seconds: float
+
+
+def configured_policies() -> list[RetentionPolicy]:
+    """Build policies from settings; Settings already restricts them to terminal statuses."""
+
+    policies = [RetentionPolicy(table="scan_events", days=settings.retention_scan_events_days)]
+    for status_name, days in settings.retention_invoice_days.items():
+        policies.append(RetentionPolicy(table="invoices", days=days, status=InvoiceStatus(status_name)))
+    return policies
+
+
+def _columns(row: Base) -> dict[str, Any]:
+    return {column.key: getattr(row, column.key) for column in row.__table__.columns}
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    raise TypeError(f"Unserializable value {type(value)!r}")
+
+
+@contextmanager
+def _single_runner(path: Path) -> Iterator[bool]:
+    """Non-blocking exclusive flock; flock conflicts across processes and open files alike."""
+
+    with open(path, "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _append_archive(path: Path, records: list[dict[str, Any]]) -> None:
+    # Each batch becomes its own gzip member; gzip/zcat read concatenated members.
+    payload = "".join(json.dumps(record, default=_json_default, ensure_ascii=False) + "\n" for record in records)
+    with gzip.open(path, "ab") as handle:
+        handle.write(payload.encode())
+    with open(path, "rb+") as raw:
+        os.fsync(raw.fileno())
+
+
+class RetentionService:
+    def __init__(
+        self,
+        session_factories: Sequence[async_sessionmaker[AsyncSession]] | None = None,
+        *,
+        archive_dir: Path | None = None,
+        batch_size: int | None = None,
+        pause_sec: float | None = None,
+    ):
+        self.session_factories = session_factories or shards.session_factories
+        self.archive_dir = archive_dir or Path(settings.retention_archive_dir)
+        self.batch_size = batch_size or settings.retention_batch_size
+        self.pause_sec = settings.retention_batch_pause_sec if pause_sec is None else pause_sec
+
+    async def run(self, policies: list[RetentionPolicy] | None = None) -> list[RetentionReport]:
+        """Expire abandoned invoices, apply every policy once, then reclaim free pages on SQLite.
+
+        Only one run at a time may hold the archive directory; a concurrent run (another
+        uvicorn worker or the CLI) returns no reports instead of archiving rows twice.
+        """
+
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with _single_runner(self.archive_dir / LOCK_FILE) as acquired:
+            if not acquired:
+                logger.info("retention run skipped, another run holds the lock")
+                return []
+            return await self._run(policies or configured_policies())
+
+    async def _run(self, policies: list[RetentionPolicy]) -> list[RetentionReport]:
+        await self._expire_abandoned()
+        # Unique per run, so archives from different runs or hosts never interleave.
+        run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid4().hex[:8]}"
+        reports = []
+        for policy in policies:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=policy.days)
+            path = self.archive_dir / f"{policy.label}-{run_id}.ndjson.gz"
+            start = time.perf_counter()
+            rows = await self._apply(policy, cutoff, path)
+            report = RetentionReport(policy=policy, rows=rows, seconds=time.perf_counter() - start)
+            observe_retention_run(policy.label, report.rows, report.seconds)
+            logger.info(
+                "retention policy applied",
+                extra={"policy": policy.label, "rows": rows, "duration_ms": round(report.seconds * 1000, 2)},
+            )
+            reports.append(report)
+        await self._incremental_vacuum()
+        return reports
+
+    async def _expire_abandoned(self) -> int:
+        """Mark long-unscanned CREATED invoices EXPIRED so the EXPIRED policy archives them.
+
+        Scans only expire an invoice when it is scanned after its TTL, so a QR that is
+        never scanned would otherwise stay CREATED forever.
+        """
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.retention_expire_created_days)
+        total = 0
+        for session_factory in self.session_factories:
+            while True:
+                async with session_factory() as session:
+                    ids = (
+                        select(Invoice.id)
+                        .where(Invoice.status == InvoiceStatus.CREATED, Invoice.created_at < cutoff)
+                        .limit(self.batch_size)
+                        .scalar_subquery()
+                    )
+                    result = await session.execute(
+                        update(Invoice)
+                        .where(Invoice.id.in_(ids))
+                        .values(status=InvoiceStatus.EXPIRED, updated_at=datetime.now(timezone.utc))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+                total += result.rowcount
+                if result.rowcount < self.batch_size:
+                    break
+                await asyncio.sleep(self.pause_sec)
+        if total:
+            logger.info("abandoned invoices expired", extra={"rows": total})
+        return total
+
+    async def _apply(self, policy: RetentionPolicy, cutoff: datetime, path: Path) -> int:
+        # Shards are drained one after another into the same archive file.
+        total = 0
+        for session_factory in self.session_factories:
+            while True:
+                async with session_factory() as session:
+                    if policy.table == "scan_events":
+                        rows = await self._archive_scan_events(session, cutoff, path)
+                    else:
+                        rows = await self._archive_invoices(session, policy.status, cutoff, path)
+                total += rows
+                observe_retention_batch(policy.label, rows)
+                if rows < self.batch_size:
+                    break
+                await asyncio.sleep(self.pause_sec)
+        return total
+
+    async def _archive_scan_events(self, session: AsyncSession, cutoff: datetime, path: Path) -> int:
+        stmt = (
+            select(ScanEvent)
+            .where(ScanEvent.created_at < cutoff)
+            .order_by(ScanEvent.created_at, ScanEvent.id)
+            .limit(self.batch_size)
+        )
+        events = (await session.execute(stmt)).scalars().all()
+        if not events:
+            return 0
+        await asyncio.to_thread(_append_archive, path, [_columns(event) for event in events])
+        await session.execute(delete(ScanEvent).where(ScanEvent.id.in_([event.id for event in events])))
+        await session.commit()
+        return len(events)
+
+    async def _archive_invoices(self, session: AsyncSession, status: InvoiceStatus, cutoff: datetime, path: Path) -> int:
+        stmt = (
+            select(Invoice)
+            .where(Invoice.status == status, Invoice.created_at < cutoff)
+            .options(selectinload(Invoice.fingerprint), selectinload(Invoice.scan_events))
+            .order_by(Invoice.created_at, Invoice.id)
+            .limit(self.batch_size)
+        )
+        invoices = (await session.execute(stmt)).scalars().all()
+        if not invoices:
+            return 0
+        records = []
+        for invoice in invoices:
+            record = _columns(invoice)
+            record["fingerprint"] = _columns(invoice.fingerprint) if invoice.fingerprint else None
+            record["scan_events"] = [_columns(event) for event in invoice.scan_events]
+            records.append(record)
+        # Archive is durable before anything is deleted; a crash only re-archives a batch.
+        await asyncio.to_thread(_append_archive, path, records)
+
+        ids = [invoice.id for invoice in invoices]
+        # SQLite does not enforce ON DELETE CASCADE without PRAGMA foreign_keys.
+        await session.execute(delete(ScanEvent).where(ScanEvent.invoice_id.in_(ids)))
+        await session.execute(delete(Fingerprint).where(Fingerprint.invoice_id.in_(ids)))
+        await session.execute(delete(Invoice).where(Invoice.id.in_(ids)))
+        await session.commit()
+        return len(invoices)
+
+    async def _incremental_vacuum(self) -> None:
+        if settings.retention_vacuum_pages <= 0:
+            return
+        for index, engine in enumerate(shards.engines):
+            if engine.dialect.name != "sqlite":
+                continue
+            async with engine.connect() as conn:
+                mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+                if mode != 2:
+                    # auto_vacuum only changes on a fresh file or after a one-time VACUUM.
+                    logger.warning("incremental vacuum unavailable, run a one-time VACUUM", extra={"shard": index})
+                    continue
+                before = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+                # exec_driver_sql steps the pragma once, freeing a single page; a script
+                # runs it to completion.
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({settings.retention_vacuum_pages});")
+                after = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+                await conn.commit()
+            logger.info("incremental vacuum", extra={"shard": index, "pages_freed": before - after})
+
+
+async def run_retention_forever() -> None:
+    """Background loop started by the API when retention is enabled."""
+
+    service = RetentionService()
+    while True:
+        try:
+            await service.run()
+        except Exception:
+            logger.exception("retention run failed")
+        await asyncio.sleep(settings.retention_interval_sec)
+
+
+if __name__ == "__main__":
+    from ..logging_conf import configure_logging
+
+    configure_logging()
+    try:
+        asyncio.run(RetentionService().run())
+    except Exception:
+        logger.exception("retention run failed")
+        raise SystemExit(1)
@@ -1,11 +1,9 @@
 """Scan callback handling services."""
 from __future__ import annotations
 
-import hmac
 import json
 import time
 from dataclasses import dataclass
-from hashlib import sha256
 from typing import Any
 
 from sqlalchemy import select
@@ -13,6 +11,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from ..config import settings
+from ..fingerprint import FingerprintData, SignatureError, verify_fingerprint, verify_signature
 from ..models import Fingerprint, Invoice, InvoicePolicy, InvoiceStatus, ScanEvent
 from .errors import err_bad_payload, err_fp_expired, err_replay, err_sig_invalid
 
@@ -32,25 +31,30 @@ class ScanService:
         *,
         fingerprint_b64: str,
         signature_hex: str,
-        timestamp: int,
-        nonce: str,
+        timestamp: int | None = None,
+        nonce: str | None = None,
         device_id: str | None = None,
         client_meta: dict[str, Any] | None = None,
     ) -> ScanResult:
-        fp_row = await self._fetch_fingerprint(fingerprint_b64)
+        try:
+            fp_data = verify_fingerprint(fingerprint_b64, signature_hex, settings.hmac_secret)
+        except SignatureError as exc:
+            raise err_sig_invalid() from exc
+        except ValueError as exc:
+            raise err_bad_payload("Malformed fingerprint") from exc
+
+        fp_row = await self._fetch_fingerprint(fingerprint_b64, fp_data)
         if not fp_row:
             raise err_bad_payload("Fingerprint not found")
 
         invoice = fp_row.invoice
 
-        expected_sig = hmac.new(settings.hmac_secret.encode(), fingerprint_b64.encode(), sha256).hexdigest()
-        if not hmac.compare_digest(signature_hex, expected_sig):
-            raise err_sig_invalid()
-        if not hmac.compare_digest(fp_row.sig_hex, expected_sig):
+        if not verify_signature(fingerprint_b64, fp_row.sig_hex, settings.hmac_secret, fp_data.algorithm):
             raise err_sig_invalid("Fingerprint signature mismatch")
-        if fp_row.nonce != nonce:
+        # Compact payloads omit Tag 62 sub-tags 03/04; they are embedded in the FP.
+        if nonce is not None and fp_row.nonce != nonce:
             raise err_bad_payload("Nonce mismatch")
-        if fp_row.ts != timestamp:
+        if timestamp is not None and fp_row.ts != timestamp:
             raise err_bad_payload("Timestamp mismatch")
 
         now = int(time.time())
@@ -80,12 +84,13 @@ class ScanService:
 
         return ScanResult(invoice=invoice, status_changed=invoice.status != previous_status)
 
-    async def _fetch_fingerprint(self, fp_b64: str) -> Fingerprint | None:
-        stmt = (
-            select(Fingerprint)
-            .where(Fingerprint.fp_b64 == fp_b64)
-            .options(selectinload(Fingerprint.invoice))
-            .limit(1)
-        )
+    async def _fetch_fingerprint(self, fp_b64: str, fp_data: FingerprintData) -> Fingerprint | None:
+        stmt = select(Fingerprint).options(selectinload(Fingerprint.invoice)).limit(1)
+        if fp_data.compact:
+            # Compact FPs carry the invoice id, so use the unique invoice_id index
+            # instead of scanning fp_b64.
+            stmt = stmt.where(Fingerprint.invoice_id == fp_data.invoice_id, Fingerprint.fp_b64 == fp_b64)
+        else:
+            stmt = stmt.where(Fingerprint.fp_b64 == fp_b64)
         result = await self.session.execute(stmt)
         return result.scalars().first()
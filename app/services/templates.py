@@ -0,0 +1,91 @@
+"""Merchant payload registry: content-addressed QRIS base templates."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from hashlib import sha256
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Merchant, MerchantTemplate
+from ..qris_encoder import normalize_base_payload
+from .errors import err_bad_payload
+
+
+@dataclass(slots=True)
+class RegisterResult:
+    template: MerchantTemplate
+    created: bool
+
+
+class TemplateService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def register(self, merchant_payload: str) -> RegisterResult:
+        """Validate and store a base payload once; identical payloads share one row."""
+
+        try:
+            base = normalize_base_payload(merchant_payload)
+        except ValueError as exc:
+            raise err_bad_payload(f"Invalid merchant payload: {exc}") from exc
+
+        template_id = sha256(base.payload.encode()).hexdigest()
+        existing = await self.session.get(MerchantTemplate, template_id)
+        if existing is not None:
+            return RegisterResult(template=existing, created=False)
+
+        template = MerchantTemplate(
+            id=template_id,
+            payload=base.payload,
+            merchant_name=base.merchant_name,
+            merchant_city=base.merchant_city,
+        )
+        self.session.add(template)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            # Registered concurrently by another request; reuse that row.
+            await self.session.rollback()
+            existing = await self.session.get(MerchantTemplate, template_id)
+            if existing is None:
+                raise
+            return RegisterResult(template=existing, created=False)
+        return RegisterResult(template=template, created=True)
+
+    async def get(self, template_id: str) -> MerchantTemplate:
+        template = await self.session.get(MerchantTemplate, template_id)
+        if template is None:
+            raise err_bad_payload("Template not found")
+        return template
+
+    async def assign(self, merchant_id: str, template: MerchantTemplate) -> Merchant:
+        """Set the default template used when a QR request carries no payload."""
+
+        merchant = await self.session.get(Merchant, merchant_id)
+        if merchant is None:
+            merchant = Merchant(id=merchant_id, template_id=template.id)
+            self.session.add(merchant)
+        else:
+            merchant.template_id = template.id
+        await self.session.commit()
+        await self.session.refresh(merchant)
+        return merchant
+
+    async def resolve(
+        self,
+        *,
+        merchant_id: str,
+        template_id: str | None = None,
+        merchant_payload: str | None = None,
+    ) -> MerchantTemplate:
+        """Pick the template for a QR request: explicit id, inline payload, or merchant default."""
+
+        if template_id is not None:
+            return await self.get(template_id)
+        if merchant_payload is not None:
+            return (await self.register(merchant_payload)).template
+        merchant = await self.session.get(Merchant, merchant_id)
+        if merchant is None:
+            raise err_bad_payload("No template_id, merchant_payload or registered template for merchant")
+        return await self.get(merchant.template_id)
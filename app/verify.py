@@ -0,0 +1,220 @@
+"""Offline verifier for QRIS payload dumps.
+
+Usage: ``python -m app.verify [INPUT] [--output OUT] [--workers N] [--chunk-size N]``
+
+Reads one payload per line from INPUT (or stdin), checks TLV structure, Tag 63
+CRC, the Tag 62 signature and fingerprint contents, and writes one NDJSON result
+per line followed by a summary record. Chunks are verified in a process pool with
+a bounded number of chunks in flight, so memory stays flat for any input size.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import IO, Any, Iterable, Iterator
+
+from .config import settings
+from .crc import crc16_ccitt
+from .fingerprint import ALG_LEGACY, SignatureError, verify_fingerprint
+from .tlv import TLVItem, parse_tlv
+
+logger = logging.getLogger("qriscuy.verify")
+
+Chunk = tuple[int, list[str]]
+
+# Legacy generators wrote Tag 62 (and a long sub-tag 01) with a 3-digit length once
+# the value passed 99 characters, e.g. ``62211...``; strict EMV parsing rejects them.
+_LEGACY_WIDE_TAGS = frozenset({"62"})
+_LEGACY_WIDE_SUBTAGS = frozenset({"01"})
+
+
+def _parse_legacy_tlv(payload: str, wide_tags: frozenset[str]) -> list[TLVItem] | None:
+    """Parse TLV letting ``wide_tags`` carry a 3-digit length; ``None`` if nothing fits.
+
+    Backtracks over the two widths, so a value that merely starts with digits cannot
+    derail the parse: a width is kept only if the rest of the payload parses too.
+    """
+
+    if not payload:
+        return []
+    tag = payload[:2]
+    for width in (2, 3) if tag in wide_tags else (2,):
+        digits = payload[2 : 2 + width]
+        if len(digits) != width or not digits.isdigit() or (width == 3 and int(digits) < 100):
+            continue
+        end = 2 + width + int(digits)
+        if end > len(payload):
+            continue
+        rest = _parse_legacy_tlv(payload[end:], wide_tags)
+        if rest is not None:
+            return [TLVItem(tag=tag, value=payload[2 + width : end]), *rest]
+    return None
+
+
+def _parse(payload: str, wide_tags: frozenset[str]) -> tuple[list[TLVItem], bool]:
+    """Strict parse first, then the legacy fallback; return ``(items, legacy_length)``."""
+
+    try:
+        return list(parse_tlv(payload)), False
+    except ValueError:
+        items = _parse_legacy_tlv(payload, wide_tags)
+        if items is None:
+            raise
+        return items, True
+
+
+def verify_payload(payload: str, secret: str) -> dict[str, Any]:
+    """Verify a single EMV payload; return a result dict with ``ok`` and ``errors``."""
+
+    result: dict[str, Any] = {"ok": False, "errors": []}
+    errors: list[dict[str, str]] = result["errors"]
+
+    try:
+        items, legacy_length = _parse(payload, _LEGACY_WIDE_TAGS)
+    except ValueError as exc:
+        errors.append({"code": "ERR_TLV", "message": str(exc)})
+        return result
+
+    if not items or items[-1].tag != "63" or len(items[-1].value) != 4:
+        errors.append({"code": "ERR_CRC", "message": "Tag 63 missing or not last"})
+    elif crc16_ccitt(payload[:-4]) != items[-1].value.upper():
+        errors.append({"code": "ERR_CRC", "message": "CRC mismatch"})
+
+    tag62 = next((item for item in items if item.tag == "62"), None)
+    if tag62 is None:
+        errors.append({"code": "ERR_TAG62", "message": "Tag 62 missing"})
+        return result
+    try:
+        subitems, legacy_sub_length = _parse(tag62.value, _LEGACY_WIDE_SUBTAGS)
+    except ValueError as exc:
+        errors.append({"code": "ERR_TAG62", "message": str(exc)})
+        return result
+    sub = {item.tag: item.value for item in subitems}
+    if legacy_length or legacy_sub_length:
+        # Still verified, but flagged: the payload is not valid EMV as printed.
+        result["legacy_length"] = True
+    if "01" not in sub or "02" not in sub:
+        errors.append({"code": "ERR_TAG62", "message": "Fingerprint or signature sub-tag missing"})
+        return result
+
+    try:
+        data = verify_fingerprint(sub["01"], sub["02"], secret)
+    except SignatureError as exc:
+        errors.append({"code": "ERR_SIG_INVALID", "message": str(exc)})
+        return result
+    except ValueError as exc:
+        errors.append({"code": "ERR_FP", "message": str(exc)})
+        return result
+
+    result.update(invoice_id=data.invoice_id, amount=data.amount, timestamp=data.timestamp, algorithm=data.algorithm)
+    if sub.get("05", ALG_LEGACY) != data.algorithm:
+        errors.append({"code": "ERR_ALG", "message": "Sub-tag 05 does not match fingerprint format"})
+    if "03" in sub and sub["03"] != str(data.timestamp):
+        errors.append({"code": "ERR_FP_MISMATCH", "message": "Sub-tag 03 differs from fingerprint timestamp"})
+    if "04" in sub and sub["04"] != data.nonce:
+        errors.append({"code": "ERR_FP_MISMATCH", "message": "Sub-tag 04 differs from fingerprint nonce"})
+
+    result["ok"] = not errors
+    return result
+
+
+def _verify_chunk(chunk: Chunk, secret: str) -> list[dict[str, Any]]:
+    start, lines = chunk
+    results = []
+    for offset, line in enumerate(lines):
+        payload = line.strip()
+        if not payload:
+            continue
+        results.append({"line": start + offset, **verify_payload(payload, secret)})
+    return results
+
+
+def _chunks(stream: Iterable[str], size: int) -> Iterator[Chunk]:
+    iterator = iter(stream)
+    line_no = 1
+    while True:
+        lines = list(islice(iterator, size))
+        if not lines:
+            return
+        yield line_no, lines
+        line_no += len(lines)
+
+
+def _run_pool(chunks: Iterator[Chunk], secret: str, workers: int) -> Iterator[list[dict[str, Any]]]:
+    if workers <= 1:
+        for chunk in chunks:
+            yield _verify_chunk(chunk, secret)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded window of chunks in flight and emit results in input order.
+        pending: deque[Future[list[dict[str, Any]]]] = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_verify_chunk, chunk, secret))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def run(source: IO[str], sink: IO[str], *, secret: str, workers: int, chunk_size: int) -> dict[str, Any]:
+    """Verify every line of ``source`` and write NDJSON to ``sink``; return the summary."""
+
+    started = time.perf_counter()
+    totals: Counter[str] = Counter()
+    error_codes: Counter[str] = Counter()
+    for results in _run_pool(_chunks(source, chunk_size), secret, workers):
+        for record in results:
+            totals["total"] += 1
+            totals["ok" if record["ok"] else "failed"] += 1
+            error_codes.update(error["code"] for error in record["errors"])
+            sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+    summary = {
+        "summary": True,
+        "total": totals["total"],
+        "ok": totals["ok"],
+        "failed": totals["failed"],
+        "errors": dict(error_codes),
+        "elapsed_sec": round(time.perf_counter() - started, 3),
+    }
+    sink.write(json.dumps(summary) + "\n")
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.verify", description="Verify QRIS payload dumps offline.")
+    parser.add_argument("input", nargs="?", default="-", help="File with one payload per line ('-' for stdin)")
+    parser.add_argument("--output", default="-", help="NDJSON output file ('-' for stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    source: IO[str] | None = None
+    sink: IO[str] | None = None
+    try:
+        # Opened inside the try so a missing or unreadable file is logged, not a traceback.
+        source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", errors="replace")
+        sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        summary = run(source, sink, secret=settings.hmac_secret, workers=args.workers, chunk_size=max(1, args.chunk_size))
+    except Exception:
+        logger.exception("verification aborted")
+        return 1
+    finally:
+        if source is not None and source is not sys.stdin:
+            source.close()
+        if sink is not None and sink is not sys.stdout:
+            sink.close()
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    from .logging_conf import configure_logging
+
+    configure_logging()
+    raise SystemExit(main())